@@ -0,0 +1,96 @@
+import sys
+import Queue
+import threading
+import traceback
+
+from multiprocessing.pool import ThreadPool
+
+class AsyncSTServer(object):
+    """
+    Runs the operations of an STServer on a pool of worker threads which
+    lives as long as this object, for bulk work on many bundles. Every
+    STServer method is available and returns an AsyncResult right away,
+    use get() on it to wait for the outcome:
+
+        aconn = AsyncSTServer(srv, 16)
+        pending = [aconn.getSmartAppDetails(uuid) for uuid in uuids]
+        details = [p.get() for p in pending]
+
+    At most maxpending calls are queued or running at any time, submitting
+    more blocks until some have finished. The plain STServer API stays
+    available for simple use.
+    """
+    MAX_PENDING = 1000
+
+    def __init__(self, conn, workers=16, maxpending=MAX_PENDING):
+        self.conn = conn
+        self.workers = max(1, workers)
+        self.pool = ThreadPool(self.workers)
+        self.pending = threading.BoundedSemaphore(max(maxpending, self.workers))
+        conn.setConcurrency(self.workers)
+
+    def submit(self, func, *args, **kwargs):
+        """ Queues func(*args, **kwargs) for a worker, returns its AsyncResult """
+        self.pending.acquire()
+        def run():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.pending.release()
+        return self.pool.apply_async(run)
+
+    def __getattr__(self, name):
+        attr = getattr(self.conn, name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kwargs):
+            return self.submit(attr, *args, **kwargs)
+        return call
+
+    def imap(self, func, items):
+        """
+        Calls func for every item on the pool, yielding (item, result) in the
+        order they complete. Should func raise, the error is printed and None
+        is yielded as the result. Works like runParallel, but the threads
+        and the limit on pending calls are shared with everything else
+        running on this object.
+        """
+        done = Queue.Queue()
+        def worker(item):
+            try:
+                done.put((item, func(item)))
+            except Exception:
+                sys.stderr.write("ERROR: %s" % traceback.format_exc())
+                done.put((item, None))
+
+        count = 0
+        for item in items:
+            self.submit(worker, item)
+            count += 1
+            # Hand out what's finished while we keep queueing
+            while True:
+                try:
+                    result = done.get_nowait()
+                except Queue.Empty:
+                    break
+                count -= 1
+                yield result
+        while count > 0:
+            # A timeout keeps the wait interruptible with CTRL-C
+            try:
+                result = done.get(timeout=1)
+            except Queue.Empty:
+                continue
+            count -= 1
+            yield result
+
+    def close(self):
+        """ Waits for everything queued to finish and stops the workers """
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
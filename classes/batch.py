@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import StringIO
+import traceback
+import collections
+
+from classes.parallel import runParallel
+from classes.parsing import parseJobs
+
+class ConsoleBatch(object):
+    """
+    Runs a console script without going through the prompt. The whole
+    script is parsed before anything is done, so a typo doesn't leave the
+    work half done. Paths are resolved as the commands are read, loading
+    every SA/DTH only once.
+
+    put, get and publish only depend on what came before them on the same
+    SA/DTH, so they're queued up, one queue per SA/DTH, and the queues are
+    worked on in parallel. Should something in a queue fail, the rest of
+    it is skipped. Any other command waits for all queued work to be done
+    and runs by itself, like at the prompt.
+
+    Whether a command failed is told by the console (see
+    ConsoleAccess.failed) or, for queued work, by the result of the
+    requests. Once done, a JSON summary with the outcome of every command
+    is printed as the last line.
+    """
+    QUEUED = ["put", "get", "publish"]
+    # These only change where later commands go, queued work can continue
+    NAVIGATION = ["cd", "lcd", "lmkdir"]
+
+    def __init__(self, console, jobs=4):
+        self.console = console
+        self.jobs = max(1, jobs)
+        self.pending = []
+        self.targets = set()
+        self.refresh = set()
+        self.results = []
+
+    def parse(self, lines):
+        """ Returns the commands of the script as (line number, text, command, argument), or None on errors """
+        commands = []
+        valid = True
+        for number, text in enumerate(lines, 1):
+            text = text.strip()
+            if text == "" or text.startswith("#"):
+                continue
+            cmd, arg, text = self.console.parseline(text)
+            if cmd is None or not hasattr(self.console, "do_" + cmd):
+                print('ERROR: Unknown command on line %d: "%s"' % (number, text))
+                valid = False
+            commands.append((number, text, cmd, arg))
+        if not valid:
+            return None
+        return commands
+
+    def run(self, lines):
+        """ Runs the script, returns True if no command failed """
+        commands = self.parse(lines)
+        if commands is None:
+            return False
+
+        self.results = []
+        for number, text, cmd, arg in commands:
+            self.results.append({"line" : number, "command" : text, "status" : "skipped", "time" : 0.0})
+
+        start = time.time()
+        for index, (number, text, cmd, arg) in enumerate(commands):
+            result = self.results[index]
+            if cmd in ConsoleBatch.QUEUED:
+                ops = self.plan(lambda: getattr(self, "plan_" + cmd)(index, arg))
+                if ops is None:
+                    result["status"] = "failed"
+                else:
+                    result["status"] = "ok"
+                    self.pending.extend(ops)
+            elif cmd in ConsoleBatch.NAVIGATION:
+                ok = self.plan(lambda: self.runCommand(text) or None)
+                result["status"] = "ok" if ok else "failed"
+            else:
+                self.flush()
+                began = time.time()
+                ok = self.runCommand(text)
+                result["time"] = round(time.time() - began, 3)
+                if ok is None:
+                    # EOF, the rest of the script is skipped
+                    result["status"] = "ok"
+                    break
+                result["status"] = "ok" if ok else "failed"
+        self.flush()
+
+        summary = {"commands" : self.results, "time" : round(time.time() - start, 3)}
+        for status in ["ok", "failed", "skipped"]:
+            summary[status] = len([r for r in self.results if r["status"] == status])
+        print(json.dumps(summary))
+        return summary["failed"] == 0
+
+    def plan(self, func):
+        """
+        Calls func, which returns None if it failed. If it did, it might be
+        because of work still queued (say, a file being uploaded), so that
+        is done first and func is given another chance.
+        """
+        output = StringIO.StringIO()
+        saved = sys.stdout
+        sys.stdout = output
+        try:
+            result = func()
+        finally:
+            sys.stdout = saved
+        if result is None and self.pending:
+            self.flush()
+            return func()
+        sys.stdout.write(output.getvalue())
+        return result
+
+    def runCommand(self, text):
+        """ Runs a single command like at the prompt, returns True if it succeeded, None on EOF """
+        try:
+            text = self.console.precmd(text)
+            stop = self.console.onecmd(text)
+            stop = self.console.postcmd(stop, text)
+        except Exception:
+            sys.stderr.write("ERROR: %s" % traceback.format_exc())
+            return False
+        if stop:
+            return None
+        return not self.console.failed
+
+    def addOp(self, index, key, run, report, ok, jobs=1):
+        """ Describes a piece of work for the queue of the SA/DTH key, using up to jobs threads of its own """
+        return {"index" : index, "key" : key, "run" : run, "report" : report, "ok" : ok, "jobs" : jobs}
+
+    def plan_put(self, index, arg):
+        src = os.path.abspath(arg)
+        job = self.console.planPut(src, self.console.cwd)
+        if job is None:
+            return None
+        if job["name"] in self.targets:
+            # Should be an update after the first one is done
+            self.flush()
+            job = self.console.planPut(src, self.console.cwd)
+            if job is None:
+                return None
+        self.targets.add(job["name"])
+        if job["action"] == "upload":
+            self.refresh.add(job["base"]["name"])
+
+        def report(result):
+            ok = isPushed(job, result)
+            print('%s "%s" ... %s' % ("Updating" if job["action"] == "update" else "Uploading", arg, "OK" if ok else "Failed"))
+            if job["action"] == "update" and result is not None:
+                self.console.printCompileResult(result)
+        return [self.addOp(index, job["base"]["parent"], lambda: self.console.pushFile(job), report, lambda result: isPushed(job, result))]
+
+    def plan_get(self, index, arg):
+        jobs, arg = parseJobs(arg)
+        if arg == "":
+            print("ERROR: Need file or directory name")
+            return None
+        if arg[0] == "/":
+            filename = arg
+        else:
+            filename = self.console.cwd + "/" + arg
+        path = os.path.dirname(filename)
+        if path != self.console.cwd and path != "":
+            self.console.resolvePath(path)
+        if filename not in self.console.tree:
+            print('ERROR: No such file "%s"' % filename)
+            return None
+
+        item = self.console.tree[filename]
+        if item["dir"]:
+            dirs, files = self.console.planGet(filename, os.path.basename(item["name"]), max(jobs, self.jobs))
+            for d in dirs:
+                try:
+                    os.makedirs(d)
+                except:
+                    pass
+        else:
+            files = [(item, os.path.basename(filename))]
+
+        # One piece of work per SA/DTH involved
+        bundles = collections.OrderedDict()
+        for f in files:
+            bundles.setdefault(f[0]["parent"], []).append((f[0], f[1], os.path.abspath(f[1])))
+        # "-j N" downloads N files of every SA/DTH at a time
+        ops = []
+        for key, work in bundles.items():
+            def run(work=work):
+                done = dict(runParallel(lambda w: self.console.fetchFile(w[0], w[2]), work, jobs))
+                return [done[w] for w in work]
+            def report(result, work=work):
+                for (item, dstfile, target), data in zip(work, result):
+                    if data is None:
+                        print('Downloading "%s" ... Failed' % dstfile)
+                    else:
+                        print('Downloading "%s" ... Done (%d bytes)' % (dstfile, data["size"]))
+            ops.append(self.addOp(index, key, run, report, lambda result: None not in result, jobs))
+        return ops
+
+    def plan_publish(self, index, arg):
+        if arg == "":
+            print("ERROR: You must provide module name")
+            return None
+        if arg == ".":
+            path = self.console.cwd
+        elif arg[0] == "/":
+            path = arg
+        else:
+            path = self.console.cwd + "/" + arg
+        module = self.console.getModule(path)
+        if module is None:
+            print('ERROR: Cannot find module "%s"' % arg)
+            return None
+        base = self.console.tree[module]
+        conn = self.console.conn
+
+        def run():
+            if base["type"] == 'sa':
+                return conn.publishSmartApp(base["parent"])
+            return conn.publishDeviceType(base["parent"])
+        def report(result):
+            print('Publishing "%s" ... %s' % (os.path.basename(module), "OK" if result else "Failed"))
+        return [self.addOp(index, base["parent"], run, report, lambda result: bool(result))]
+
+    def runQueue(self, queue):
+        """ Does the work queued for one SA/DTH in order, returns (op, result, ok, time) for each, ok is None if skipped """
+        done = []
+        failed = False
+        for op in queue:
+            if failed:
+                done.append((op, None, None, 0.0))
+                continue
+            start = time.time()
+            try:
+                result = op["run"]()
+                ok = op["ok"](result)
+            except Exception:
+                sys.stderr.write("ERROR: %s" % traceback.format_exc())
+                result = None
+                ok = False
+            done.append((op, result, ok, time.time() - start))
+            failed = not ok
+        return done
+
+    def flush(self):
+        """ Does all queued work, one SA/DTH per job """
+        if not self.pending:
+            return
+        queues = collections.OrderedDict()
+        for op in self.pending:
+            queues.setdefault(op["key"], []).append(op)
+        self.pending = []
+        self.targets = set()
+
+        self.console.conn.setConcurrency(self.jobs * max(op["jobs"] for op in sum(queues.values(), [])))
+        for queue, done in runParallel(self.runQueue, queues.values(), self.jobs):
+            for op, result, ok, elapsed in (done or []):
+                entry = self.results[op["index"]]
+                entry["time"] = round(entry["time"] + elapsed, 3)
+                if ok is None:
+                    print('Skipped "%s", something before it on the same SA/DTH failed' % entry["command"])
+                    if entry["status"] == "ok":
+                        entry["status"] = "skipped"
+                    continue
+                op["report"](result)
+                if not ok:
+                    entry["status"] = "failed"
+        self.console.applyLoaded()
+
+        # Show the new files
+        for module in self.refresh:
+            if module in self.console.tree:
+                self.console.refreshModule(module)
+        self.refresh = set()
+
+def isPushed(job, result):
+    """ Tells if ConsoleAccess.pushFile did job successfully """
+    if job["action"] == "update":
+        return result is not None and not result["errors"] and not result["output"]
+    return result is True
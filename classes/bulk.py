@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import fnmatch
+
+from classes.parsing import sanitizeName
+from classes.parallel import transferSummary
+from classes.asyncserver import AsyncSTServer
+
+class BulkAction(object):
+    """
+    Runs the same action on many SmartApps or DeviceTypes in one go. The
+    list of them is loaded once, to pick the bundles by UUID, by a glob on
+    "namespace/name" (or just the name) or all of them. The bundles are
+    then worked on jobs at a time and a summary of how it went for every
+    one of them is printed at the end.
+    """
+    def __init__(self, conn, kind, jobs=4, diskcache=None):
+        self.conn = conn
+        self.kind = kind
+        self.jobs = max(1, jobs)
+        self.diskcache = diskcache
+        self.listing = None
+
+    def getListing(self):
+        """ Returns the list of SA/DTH (by UUID), loading it on first use """
+        if self.listing is None:
+            if self.kind == 'sa':
+                self.listing = self.conn.listSmartApps()
+            else:
+                self.listing = self.conn.listDeviceTypes()
+            if self.listing is not None and self.diskcache:
+                self.diskcache.setList(self.kind, self.listing)
+        return self.listing
+
+    def matches(self, bundle, patterns):
+        for pattern in patterns:
+            if "/" in pattern:
+                name = bundle["namespace"] + "/" + bundle["name"]
+            else:
+                name = bundle["name"]
+            if fnmatch.fnmatch(name, pattern):
+                return True
+        return False
+
+    def select(self, uuids, everything=False, patterns=None):
+        """
+        Returns the bundles given by uuids, plus all of them if everything is
+        set or those matching any of patterns, sorted by namespace and name.
+        Returns None if the list can't be loaded or a UUID is unknown.
+        """
+        listing = self.getListing()
+        if listing is None:
+            return None
+
+        selected = {}
+        for uuid in uuids:
+            if uuid not in listing:
+                print('ERROR: No such item "%s"' % uuid)
+                return None
+            selected[uuid] = listing[uuid]
+        for uuid, bundle in listing.iteritems():
+            if everything or (patterns and self.matches(bundle, patterns)):
+                selected[uuid] = bundle
+        return sorted(selected.values(), key=lambda b: (b["namespace"].lower(), b["name"].lower(), b["id"]))
+
+    def describe(self, bundle):
+        return "%s : %s" % (bundle["namespace"], bundle["name"])
+
+    def getDetails(self, bundle):
+        if self.kind == 'sa':
+            return self.conn.getSmartAppDetails(bundle["id"])
+        return self.conn.getDeviceTypeDetails(bundle["id"])
+
+    def loadDetails(self, aconn, bundles):
+        """ Loads the contents of all bundles, returns them by UUID (None where it failed) """
+        result = {}
+        for bundle, data in aconn.imap(self.getDetails, bundles):
+            if data is None:
+                print('ERROR: Unable to get contents of "%s"' % self.describe(bundle))
+            elif self.diskcache:
+                # Only from this thread, it's written to disk once we're done
+                self.diskcache.setBundle(bundle["id"], data)
+            result[bundle["id"]] = data
+        return result
+
+    def summarize(self, bundles, status, start):
+        """ Prints how it went for every bundle, returns True if it went well for all of them """
+        failed = 0
+        print("")
+        for bundle in bundles:
+            ok = status.get(bundle["id"], False)
+            if not ok:
+                failed += 1
+            print("%36s | %-6s | %s" % (bundle["id"], "OK" if ok else "Failed", self.describe(bundle)))
+        print("%d bundle(s), %d failed in %.2fs" % (len(bundles), failed, time.time() - start))
+        return failed == 0
+
+    def contents(self, bundles):
+        """ Lists the files of every bundle, returns True if all could be loaded """
+        start = time.time()
+        with AsyncSTServer(self.conn, self.jobs) as aconn:
+            details = self.loadDetails(aconn, bundles)
+
+        # Printed in a fixed order, regardless of what loaded first
+        status = {}
+        for bundle in bundles:
+            data = details.get(bundle["id"])
+            status[bundle["id"]] = data is not None
+            if data is None:
+                continue
+            print("%s (%s)" % (self.describe(bundle), bundle["id"]))
+            for k,v in sorted(data["flat"].iteritems(), key=lambda x: x[1]):
+                print("%36s | %s" % (k, v))
+        return self.summarize(bundles, status, start)
+
+    def publish(self, bundles):
+        """ Publishes every bundle, returns True if all of them were published """
+        def publish(bundle):
+            if self.kind == 'sa':
+                return self.conn.publishSmartApp(bundle["id"])
+            return self.conn.publishDeviceType(bundle["id"])
+
+        start = time.time()
+        status = {}
+        with AsyncSTServer(self.conn, self.jobs) as aconn:
+            for bundle, result in aconn.imap(publish, bundles):
+                status[bundle["id"]] = bool(result)
+                print('Publishing "%s" ... %s' % (self.describe(bundle), "OK" if result else "Failed"))
+        return self.summarize(bundles, status, start)
+
+    def getDestination(self, dest, bundle):
+        """ Where bundle is stored, laid out like the console (<namespace>/<name>.src) """
+        return "%s/%s/%s.src" % (dest.rstrip("/"), sanitizeName(bundle["namespace"]), sanitizeName(bundle["name"]))
+
+    def download(self, bundles, dest="."):
+        """
+        Downloads every bundle into its own folder below dest. The items of
+        all bundles share the same jobs, so a large bundle doesn't hold up
+        the rest. Returns True if everything was downloaded.
+        """
+        def fetch(item):
+            bundle, itemid, filename, data = item
+            try:
+                os.makedirs(os.path.dirname(filename))
+            except:
+                pass
+            if self.kind == 'sa':
+                return self.conn.downloadSmartAppItemToFile(bundle["id"], data, itemid, filename)
+            return self.conn.downloadDeviceTypeItemToFile(bundle["id"], data, itemid, filename)
+
+        start = time.time()
+        with AsyncSTServer(self.conn, self.jobs) as aconn:
+            details = self.loadDetails(aconn, bundles)
+            status = {}
+            items = []
+            for bundle in bundles:
+                data = details.get(bundle["id"])
+                status[bundle["id"]] = data is not None
+                if data is None:
+                    continue
+                path = self.getDestination(dest, bundle)
+                for itemid, info in data["index"].iteritems():
+                    items.append((bundle, itemid, path + info["path"] + "/" + info["filename"], data))
+
+            failed = 0
+            size = 0
+            for item, content in aconn.imap(fetch, items):
+                if content is None:
+                    print("  Downloading %s: Failed" % item[2])
+                    status[item[0]["id"]] = False
+                    failed += 1
+                else:
+                    print("  Downloading %s: OK (%d bytes)" % (item[2], content["size"]))
+                    size += content["size"]
+                sys.stdout.flush()
+
+        print("Downloaded " + transferSummary(len(items), failed, size, time.time() - start))
+        return self.summarize(bundles, status, start)
@@ -0,0 +1,62 @@
+import threading
+import time
+
+class ResourceCache(object):
+    """
+    Keeps the resource list (getSmartAppDetails/getDeviceTypeDetails) of
+    bundles around for a while, so a batch of operations on the same bundle
+    only asks the server once. Entries expire after ttl seconds and must be
+    invalidated whenever the bundle's contents are changed. onLoad, if given,
+    is called with (kind, uuid, data) every time a list is loaded.
+    """
+    TTL = 60
+
+    def __init__(self, conn, ttl=TTL, onLoad=None):
+        self.conn = conn
+        self.ttl = ttl
+        self.onLoad = onLoad
+        self.entries = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def lookup(self, uuid):
+        """ Returns the cached resource list or None if missing or expired """
+        entry = self.entries.get(uuid)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def get(self, kind, uuid, notify=True):
+        """
+        Returns the resource list of the bundle, loading it from the server if
+        needed. onLoad isn't called if notify is False.
+        """
+        data = self.lookup(uuid)
+        if data is not None:
+            return data
+
+        # Only let one thread load any given bundle
+        with self.lock:
+            if uuid not in self.locks:
+                self.locks[uuid] = threading.Lock()
+            lock = self.locks[uuid]
+        with lock:
+            data = self.lookup(uuid)
+            if data is not None:
+                return data
+            if kind == 'sa':
+                data = self.conn.getSmartAppDetails(uuid)
+            elif kind == 'dth':
+                data = self.conn.getDeviceTypeDetails(uuid)
+            if data is not None:
+                self.entries[uuid] = (time.time(), data)
+                if self.onLoad and notify:
+                    self.onLoad(kind, uuid, data)
+        return data
+
+    def invalidate(self, uuid):
+        """ Forgets the resource list of a bundle """
+        self.entries.pop(uuid, None)
+
+    def clear(self):
+        self.entries = {}
@@ -1,39 +1,158 @@
 import cmd
-import re
 import sys
 import os
 import glob
 import fnmatch
+import time
+import threading
+
+from classes.tree import ConsoleTree, getRss
+from classes.cache import ResourceCache
+from classes.parallel import runParallel, transferSummary
+from classes.sync import BundleSync
+from classes.watch import BundleWatch, createWatcher
+from classes.asyncserver import AsyncSTServer
+from classes.parsing import sanitizeName, parseJobs
 
 class ConsoleAccess(cmd.Cmd):
     def updatePrompt(self):
         self.prompt = "%s/ > " % self.cwd
 
-    def setConnection(self, conn):
-        """ Assigns a STServer Connection to the console """
+    def precmd(self, line):
+        self.failed = False
+        self.applyLoaded()
+        self.applyRevalidated()
+        return line
+
+    def postcmd(self, stop, line):
+        self.applyLoaded()
+        self.applyRevalidated()
+        # Write out whatever the command (or the background work) learned
+        if self.diskcache:
+            self.diskcache.save()
+        return stop
+
+    def error(self, message):
+        """ Prints an error and marks the command being run as failed (see failed) """
+        print("ERROR: " + message)
+        self.failed = True
+
+    def setConnection(self, conn, diskcache=None, warm=0):
+        """
+        Assigns a STServer Connection to the console. If diskcache is given,
+        the tree is populated from it and lazily revalidated against the server.
+        See prefetch for warm.
+        """
         self.conn = conn
         self.cwd = ""
-        self.cache = {}
-        # Prepopulate
-        self.tree = {}
-        self.tree["/smartapps"] = {"name" : "/smartapps", "dir" : True, "uuid" : None, "parent" : None, "type" : None, "stale" : True}
-        self.tree["/devicetypes"] = {"name" : "/devicetypes", "dir" : True, "uuid" : None, "parent" : None, "type" : None, "stale" : True}
+        self.diskcache = diskcache
+        # Set once something goes wrong, reset before every command
+        self.failed = False
+        self.cache = ResourceCache(conn, onLoad=self.bundleLoaded)
+        # Lists of files loaded by other threads, see getContents
+        self.loaded = {}
+        self.loadedlock = threading.Lock()
+        self.aconn = AsyncSTServer(conn, 4)
+        self.resetTree()
+        self.prefetch(warm)
         self.updatePrompt()
 
+    def prefetch(self, warm=0):
+        """
+        Starts loading both lists of SA/DTH in the background, so they're
+        ready (or at least on their way) once needed. Lists found in the disk
+        cache are shown right away and revalidated by what's loaded here. If
+        warm is given, the contents of that many of the most recently used
+        SA/DTH are loaded too.
+        """
+        self.prefetched = {}
+        self.loading = {}
+        for kind in ['sa', 'dth']:
+            self.prefetched[kind] = (time.time(), self.aconn.submit(self.downloadList, kind))
+        if self.diskcache:
+            for base in ["/smartapps", "/devicetypes"]:
+                if self.diskcache.getList(self.getKind(base)) is not None:
+                    self.loadList(base)
+        if warm and self.diskcache:
+            for uuid in self.diskcache.getRecentBundles(warm):
+                base = self.bundles.get(uuid)
+                if base in self.tree:
+                    # Only fills the cache, the tree is updated once the SA/DTH is opened
+                    self.aconn.submit(self.cache.get, self.tree[base]["type"], uuid, False)
+
+    def resetTree(self):
+        """ Creates an empty tree with only the base folders """
+        self.tree = ConsoleTree()
+        self.bundles = {}
+        self.revalidating = {}
+        self.tree.add("/smartapps", True, kind='sa', stale=True)
+        self.tree.add("/devicetypes", True, kind='dth', stale=True)
+
     def clearCache(self):
-        self.cache = {}
+        self.cache.clear()
+
+    def invalidate(self, uuid):
+        """ Forgets everything cached about the contents of a SA/DTH """
+        self.cache.invalidate(uuid)
+        if self.diskcache:
+            self.diskcache.dropBundle(uuid)
+
+    def forgetModule(self, uuid):
+        """
+        Called when a SA/DTH was changed by something else than this console
+        (say, a command run by the daemon). Its contents are loaded from the
+        server again the next time they're needed.
+        """
+        self.invalidate(uuid)
+        base = self.bundles.get(uuid)
+        if base is None:
+            # Not known to the tree (yet), nothing to forget there
+            return
+        if base in self.tree and self.tree[base]["parent"] == uuid and not self.tree[base]["stale"]:
+            self.tree.removeTree(base)
+            self.tree.add(base, True, module=uuid, stale=True)
+        self.revalidating.pop(base, None)
+
+    def forgetList(self, kind):
+        """ Same as forgetModule, for the list of SA/DTH of kind ('sa' or 'dth') """
+        base = {'sa' : "/smartapps", 'dth' : "/devicetypes"}[kind]
+        self.prefetched.pop(kind, None)
+        if self.diskcache:
+            self.diskcache.dropList(kind)
+        for uuid, path in self.bundles.items():
+            if path.startswith(base + "/"):
+                del self.bundles[uuid]
+        for path in self.revalidating.keys():
+            if path == base or path.startswith(base + "/"):
+                del self.revalidating[path]
+        self.tree.removeTree(base)
+        self.tree.add(base, True, kind=kind, stale=True)
 
     def listBundle(self, node):
         pass
 
     def do_refresh(self, line):
-        """ Marks all directories as stale, forcing a reload from server """
-        # Prepopulate
+        """ Reloads the lists of SA/DTH and the contents of opened ones from the server, applying only what changed """
         print("Please wait, reloading...")
-        self.tree = {}
-        self.tree["/smartapps"] = {"name" : "/smartapps", "dir" : True, "uuid" : None, "parent" : None, "type" : None, "stale" : True}
-        self.tree["/devicetypes"] = {"name" : "/devicetypes", "dir" : True, "uuid" : None, "parent" : None, "type" : None, "stale" : True}
-        self.do_cd(self.cwd)
+        self.clearCache()
+        self.prefetched = {}
+        for base in ["/smartapps", "/devicetypes"]:
+            if not self.tree[base]["stale"]:
+                self.syncList(base)
+        for uuid, base in self.bundles.items():
+            if base in self.tree and self.tree[base]["parent"] == uuid and not self.tree[base]["stale"]:
+                data = self.cache.get(self.tree[base]["type"], uuid)
+                if data is not None:
+                    self.syncItems(base, data)
+        self.leaveRemoved()
+
+    def leaveRemoved(self):
+        """ Moves up from the current folder if it's gone from the tree """
+        cwd = self.cwd
+        while cwd and cwd not in self.tree:
+            cwd = self.getParent(cwd) or ""
+        self.cwd = cwd
+        self.updatePrompt()
 
     def splitPath(self, path):
         """ Splits the path into an array of parts """
@@ -54,28 +173,61 @@ class ConsoleAccess(cmd.Cmd):
             result += "/" + path[i]
         return result
 
-    def generateTrail(self, filename, kind=None, parent=None, uuid=None):
+    def generateTrail(self, filename):
         """ Fills in the gaps in the directory structure """
         parts = self.splitPath(filename)
         cd = ""
         for p in parts:
             cd += "/" + p
             if cd not in self.tree:
-                self.tree[cd] = {"name" : cd, "uuid" : uuid, "parent" : parent, "type" : kind, "stale" : False, "dir" : True}
+                self.tree.add(cd, True)
 
     def sanitizeName(self, name):
         """Replaces invalid characters in the provided name"""
-        rpl = { "/" : "-", "(" : "-", ")" : "-", " " : "-" }
-        for f,t in rpl.iteritems():
-            name = name.replace(f, t)
+        return sanitizeName(name)
+
+    def getKind(self, base):
+        """ Returns the kind of modules held by one of the base folders """
+        if base == "/smartapps":
+            return 'sa'
+        elif base == "/devicetypes":
+            return 'dth'
+        return None
 
-        # Get rid of multiple dashes in a row
-        p = re.compile('\-+')
-        name = p.sub("-", name)
-        if name[-1:] == '-':
-            name = name[:-1]
+    def fetchList(self, kind):
+        """ Returns the list of SA/DTH from the server, taking the prefetched one if it's recent enough """
+        pending = self.prefetched.pop(kind, None)
+        if pending is not None and time.time() - pending[0] < ResourceCache.TTL:
+            try:
+                data = pending[1].get()
+            except Exception:
+                # Failed in the background, give it another try from here
+                data = None
+            if data is not None:
+                return data
+        return self.downloadList(kind)
+
+    def downloadList(self, kind):
+        """ Loads the list of SA/DTH from the server and remembers it on disk """
+        if kind == 'sa':
+            data = self.conn.listSmartApps()
+        elif kind == 'dth':
+            data = self.conn.listDeviceTypes()
+        if data is not None and self.diskcache:
+            self.diskcache.setList(kind, data)
+        return data
 
-        return name.lower()
+    def getModulePath(self, base, module):
+        return base + "/" + self.sanitizeName(module["namespace"]) + "/" + self.sanitizeName(module["name"]) + ".src"
+
+    def addModules(self, base, kind, data):
+        """ Adds the SA/DTH in data to the tree, leaving already known ones alone """
+        for d in data.values():
+            filename = self.getModulePath(base, d)
+            self.bundles[d["id"]] = filename
+            if filename in self.tree and self.tree[filename]["parent"] == d["id"]:
+                continue
+            self.tree.add(filename, True, module=d["id"], stale=True)
 
     def loadList(self, base, force=False):
         """
@@ -84,18 +236,54 @@ class ConsoleAccess(cmd.Cmd):
         if not self.tree[base]["stale"]:
             return
 
-        if base == "/smartapps":
-            kind = 'sa'
-            data = self.conn.listSmartApps()
-        elif base == "/devicetypes":
-            kind = 'dth'
-            data = self.conn.listDeviceTypes()
+        kind = self.getKind(base)
+        data = None
+        if self.diskcache and not force:
+            data = self.diskcache.getList(kind)
+        self.tree[base]["cached"] = data is not None
+        if data is None:
+            data = self.fetchList(kind)
+        if data is None:
+            return
 
         self.tree[base]["stale"] = False
+        self.addModules(base, kind, data)
+        if self.tree[base]["cached"]:
+            self.revalidateLater(base)
+
+    def syncList(self, base, data=None):
+        """
+        Reloads the list of SA/DTH from the server, unless given as data,
+        and applies the differences to the tree
+        """
+        kind = self.getKind(base)
+        if data is None:
+            data = self.fetchList(kind)
+        if data is None:
+            return
+
+        wanted = {}
         for d in data.values():
-            filename = base + "/" + self.sanitizeName(d["namespace"]) + "/" + self.sanitizeName(d["name"]) + ".src"
-            self.tree[filename] = {"name" : filename, "dir" : True, "parent" : d["id"], "uuid" : None, "type" : kind, "stale" : True}
-            self.generateTrail(filename, kind=kind)
+            wanted[self.getModulePath(base, d)] = d["id"]
+        for ns in self.tree.listDir(base):
+            for name in self.tree.listDir(base + "/" + ns):
+                filename = base + "/" + ns + "/" + name
+                if wanted.get(filename) != self.tree[filename]["parent"]:
+                    self.tree.removeTree(filename)
+            if not self.tree.listDir(base + "/" + ns):
+                self.tree.removeTree(base + "/" + ns)
+        self.addModules(base, kind, data)
+        self.tree[base]["stale"] = False
+        self.tree[base]["cached"] = False
+
+    def addItems(self, base, data):
+        """ Adds the files in data to the SA/DTH at base """
+        for k,v in data["flat"].iteritems():
+            filename = base + v
+            self.tree.add(filename, False, uuid=k)
+        # Also add static folders
+        for k in self.conn.UPLOAD_TYPE.values():
+            self.generateTrail(base + "/" + k)
 
     def loadItems(self, base, force=False):
         """
@@ -103,23 +291,113 @@ class ConsoleAccess(cmd.Cmd):
         """
         entry = self.tree[base]
         if entry["stale"]:
-            if base.startswith("/smartapps/"):
-                kind = "sa"
-                data = self.conn.getSmartAppDetails(entry["parent"])
-            elif base.startswith("/devicetypes/"):
-                kind = "dth"
-                data = self.conn.getDeviceTypeDetails(entry["parent"])
-            for k,v in data["flat"].iteritems():
-                filename = base + v
-                self.tree[filename] = {"name" : filename, "dir" : False, "parent" : entry["parent"], "uuid" : k, "type" : kind, "stale" : False}
-                self.generateTrail(filename, kind, entry["parent"])
-            # Also add static folders
-            for k in self.conn.UPLOAD_TYPE.values():
-                filename = base + "/" + k
-                self.generateTrail(filename, kind, entry["parent"])
+            data = None
+            if self.diskcache and not force and self.cache.lookup(entry["parent"]) is None:
+                data = self.diskcache.getBundle(entry["parent"])
+            entry["cached"] = data is not None
+            if data is None:
+                data = self.cache.get(entry["type"], entry["parent"])
+            if data is None:
+                self.error('Unable to load contents of "%s"' % base)
+                return
+            self.addItems(base, data)
             entry["stale"] = False # Avoid loading this again
+            if entry["cached"]:
+                self.revalidateLater(base)
+
+    def syncItems(self, base, data):
+        """ Brings the files of an already loaded SA/DTH up to date with data """
+        wanted = set()
+        for v in data["flat"].values():
+            wanted.add(base + v)
+        for filename in list(self.tree.walk(base)):
+            if not self.tree[filename]["dir"] and filename not in wanted:
+                self.tree.pop(filename)
+        self.addItems(base, data)
+        self.tree[base]["cached"] = False
+
+    def bundleLoaded(self, kind, uuid, data):
+        """ Called whenever a fresh resource list of a SA/DTH has been loaded from the server """
+        if self.diskcache:
+            self.diskcache.setBundle(uuid, data)
+        # Lazily revalidate what was shown from the disk cache
+        base = self.bundles.get(uuid)
+        if base in self.tree and self.tree[base]["parent"] == uuid and self.tree[base].get("cached"):
+            self.syncItems(base, data)
+
+    def revalidateLater(self, base):
+        """
+        Starts checking what was shown of base (a base folder or a SA/DTH)
+        from the disk cache against the server in the background. The
+        outcome is applied by applyRevalidated, so only this thread ever
+        changes the tree.
+        """
+        entry = self.tree[base]
+        if entry["parent"] is None:
+            kind = self.getKind(base)
+            # The prefetched list does the job, unless it's too old
+            pending = self.prefetched.pop(kind, None)
+            if pending is None or time.time() - pending[0] >= ResourceCache.TTL:
+                pending = (time.time(), self.aconn.submit(self.downloadList, kind))
+            self.revalidating[base] = (kind, None, pending[1])
+        else:
+            kind = entry["type"]
+            self.revalidating[base] = (kind, entry["parent"], self.aconn.submit(self.cache.get, kind, entry["parent"], False))
+
+    def applyRevalidated(self):
+        """ Brings whatever revalidateLater has loaded by now into the tree """
+        changed = False
+        for base, (kind, uuid, pending) in self.revalidating.items():
+            if not pending.ready():
+                continue
+            del self.revalidating[base]
+            try:
+                data = pending.get()
+            except Exception:
+                # Stays as it is, a miss in resolvePath tries again
+                continue
+            if data is None or base not in self.tree or not self.tree[base].get("cached"):
+                continue
+            if uuid is None:
+                self.syncList(base, data)
+            elif self.tree[base]["parent"] == uuid:
+                self.bundleLoaded(kind, uuid, data)
+            changed = True
+        if changed:
+            self.leaveRemoved()
+
+    def getModule(self, path):
+        """ Returns the base folder of the SA/DTH which path belongs to, or None """
+        if path not in self.tree or self.tree[path]["parent"] is None:
+            return None
+        while self.tree[path]["parent"]:
+            prev = path
+            path = self.getParent(path)
+        return prev
 
-        #print(repr(data))
+    def revalidate(self, path):
+        """
+        Reloads whatever information path is based on from the server, if it
+        came from the disk cache. Returns True if anything was reloaded.
+        """
+        module = self.getModule(path)
+        if module is not None:
+            entry = self.tree[module]
+            if entry.get("cached") and not entry["stale"]:
+                data = self.cache.get(entry["type"], entry["parent"])
+                # Already loaded (say, by prefetch) data doesn't trigger bundleLoaded
+                if data is not None and entry.get("cached"):
+                    self.syncItems(module, data)
+                return True
+            return False
+
+        parts = self.splitPath(path)
+        if len(parts) and ("/" + parts[0]) in self.tree:
+            base = "/" + parts[0]
+            if self.tree[base].get("cached"):
+                self.syncList(base)
+                return True
+        return False
 
     def loadFromServer(self, base, force=False):
         """
@@ -133,7 +411,7 @@ class ConsoleAccess(cmd.Cmd):
             elif base in self.tree:
                 self.loadItems(base, force)
             else:
-                print("ERR: Not supported yet (%s)" % base)
+                self.error("Not supported yet (%s)" % base)
 
     def resolvePath(self, line):
         """
@@ -156,20 +434,15 @@ class ConsoleAccess(cmd.Cmd):
             elif part == "..":
                 error = True
             else:
-                found = False
-                for t in self.tree:
-                    search = cwd + "/" + part
-                    if t.startswith(search + "/") or t == search:
-                        cwd += "/" + part
-                        if not self.tree[cwd]["dir"]:
-                            error = True
-                            break
-                        found = True
-                        break
-                if not found:
+                search = cwd + "/" + part
+                if search not in self.tree:
+                    # Might be missing because the cached information is outdated
+                    self.revalidate(cwd)
+                if search not in self.tree or not self.tree[search]["dir"]:
                     error = True
                     break
-                elif cwd in self.tree and self.tree[cwd]["stale"]:
+                cwd = search
+                if self.tree[cwd]["stale"]:
                     self.loadFromServer(cwd)
         if error:
             return None
@@ -195,94 +468,260 @@ class ConsoleAccess(cmd.Cmd):
         """ We don't want to repeat the last command """
         pass
 
-    def downloadFile(self, item, dstfile, cache=False):
-        """ Downloads a specific file to dstfile, does NOT create folder structure! """
-        tries = 3
+    def absolutePath(self, path):
+        """ Returns the absolute version of path without loading anything """
+        parts = []
+        if path[:1] != "/":
+            parts = self.splitPath(self.cwd)
+        for part in self.splitPath(path):
+            if part == "..":
+                if len(parts):
+                    parts.pop()
+            elif part != ".":
+                parts.append(part)
+        if len(parts) == 0:
+            return ""
+        return "/" + "/".join(parts)
+
+    def isListable(self, path):
+        """
+        Returns True if the folder path can be listed without waiting for the
+        server. If not, whatever is missing is loaded in the background, so
+        it's there by the time the user asks again.
+        """
+        entry = self.tree[path]
+        if not entry["stale"]:
+            return True
+        if entry["parent"] is None:
+            kind = self.getKind(path)
+            if self.diskcache is None or self.diskcache.getList(kind) is None:
+                pending = self.prefetched.get(kind)
+                if pending is None or time.time() - pending[0] >= ResourceCache.TTL or (pending[1].ready() and (not pending[1].successful() or pending[1].get() is None)):
+                    self.prefetched[kind] = (time.time(), self.aconn.submit(self.downloadList, kind))
+                    return False
+                if not pending[1].ready():
+                    return False
+        else:
+            uuid = entry["parent"]
+            if self.cache.lookup(uuid) is None and (self.diskcache is None or self.diskcache.getBundle(uuid) is None):
+                pending = self.loading.get(uuid)
+                if pending is None or pending.ready():
+                    # Only fills the cache, the tree is updated here once it's done
+                    self.loading[uuid] = self.aconn.submit(self.cache.get, entry["type"], uuid, False)
+                return False
+        self.loading.pop(entry["parent"], None)
+        self.loadFromServer(path)
+        return not self.tree[path]["stale"]
+
+    def completePath(self, text, line, endidx, local=False):
+        """
+        Returns the completions of the path being typed, remote or local.
+        Readline only hands us the text after the last delimiter (which
+        includes "/" and "-"), so the whole argument is taken from line.
+        """
+        arg = line[:endidx].split(" ")[-1]
+        folder, _, prefix = arg.rpartition("/")
+        if local:
+            localdir = os.path.expanduser(folder) if folder else "."
+            if arg[:1] == "/" and folder == "":
+                localdir = "/"
+            try:
+                names = [n for n in os.listdir(localdir) if n.startswith(prefix)]
+            except OSError:
+                return []
+            isdir = lambda n: os.path.isdir(os.path.join(localdir, n))
+        else:
+            path = ""
+            if folder or arg[:1] != "/":
+                path = self.absolutePath(folder)
+            if path != "" and (path not in self.tree or not self.tree[path]["dir"] or not self.isListable(path)):
+                return []
+            names = [n for n in self.tree.listDir(path) if n.startswith(prefix)]
+            isdir = lambda n: self.tree[path + "/" + n]["dir"]
+            if len(names) == 1 and isdir(names[0]):
+                # Likely to be entered next, get it ready
+                self.isListable(path + "/" + names[0])
+
+        start = arg[:len(arg) - len(prefix)]
+        offset = len(arg) - len(text)
+        result = []
+        for n in names:
+            if isdir(n):
+                n += "/"
+            result.append((start + n)[offset:])
+        return sorted(result)
+
+    def complete_cd(self, text, line, begidx, endidx):
+        return self.completePath(text, line, endidx)
+
+    complete_ls = complete_cd
+    complete_dir = complete_cd
+    complete_get = complete_cd
+    complete_rm = complete_cd
+    complete_rmdir = complete_cd
+
+    def complete_put(self, text, line, begidx, endidx):
+        return self.completePath(text, line, endidx, local=True)
+
+    complete_mput = complete_put
+    complete_lcd = complete_put
+    complete_lls = complete_put
+
+    def getContents(self, item):
+        """
+        Returns the list of files of the SA/DTH item belongs to. May be used
+        from any thread, the tree only learns about a list loaded here once
+        applyLoaded is called.
+        """
+        known = self.cache.lookup(item["parent"])
+        contents = self.cache.get(item["type"], item["parent"], False)
+        if contents is not None and contents is not known:
+            with self.loadedlock:
+                self.loaded[item["parent"]] = (item["type"], contents)
+        return contents
+
+    def applyLoaded(self):
+        """ Hands the lists of files getContents loaded by now to bundleLoaded, from this thread """
+        with self.loadedlock:
+            loaded = self.loaded
+            self.loaded = {}
+        for uuid, (kind, data) in loaded.iteritems():
+            self.bundleLoaded(kind, uuid, data)
+
+    def fetchFile(self, item, dstfile):
+        """
+        Downloads a specific file to dstfile, returns its details (including
+        size) or None. Failing requests are already retried by STServer, so
+        this only tries once more with a fresh list of the files, in case the
+        one we have is outdated. May be used from any thread (see
+        getContents).
+        """
+        tries = 2
 
         while tries > 0:
-            sys.stdout.write('Downloading "%s" ... ' % dstfile)
-            sys.stdout.flush()
-
-            if item["type"] == 'sa':
-                contents = self.cache.get(item["parent"], self.conn.getSmartAppDetails(item["parent"]))
-                data = self.conn.downloadSmartAppItem(item["parent"], contents["details"], item["uuid"])
+            data = None
+            contents = self.getContents(item)
+            if contents is None:
+                pass
+            elif item["type"] == 'sa':
+                data = self.conn.downloadSmartAppItemToFile(item["parent"], contents, item["uuid"], dstfile)
             elif item["type"] == 'dth':
-                contents = self.cache.get(item["parent"], self.conn.getDeviceTypeDetails(item["parent"]))
-                data = self.conn.downloadDeviceTypeItem(item["parent"], contents["details"], item["uuid"])
+                data = self.conn.downloadDeviceTypeItemToFile(item["parent"], contents, item["uuid"], dstfile)
 
-            # Store in cache if possible
-            if contents and cache and data:
-                self.cache[item["parent"]] = contents
             if data is None:
                 tries -= 1
-                print("Failed")
-                print("WARNING: Backend didn't find the file, possible file overloading issue.")
+                # The list might be outdated, get a fresh one
+                self.cache.invalidate(item["parent"])
+                print('WARNING: Backend didn\'t find "%s", possible file overloading issue.' % item["name"])
                 if tries > 0:
-                    print("         Retrying %d times more" % tries)
+                    print("         Retrying with a fresh list of files")
             else:
                 break
 
-        if data["data"] is None:
+        return data
+
+    def downloadFile(self, item, dstfile):
+        """ Downloads a specific file to dstfile, does NOT create folder structure! """
+        sys.stdout.write('Downloading "%s" ... ' % dstfile)
+        sys.stdout.flush()
+
+        data = self.fetchFile(item, dstfile)
+        if data is None:
             print("Failed")
+            self.failed = True
             return False
 
-        with open(dstfile, "wb") as f:
-            f.write(data["data"])
-
-        print("Done (%d bytes)" % len(data["data"]))
+        print("Done (%d bytes)" % data["size"])
         return True
 
-    def updateFile(self, item, filename):
-        sys.stdout.write('Updating "%s" ... ' % filename)
-        sys.stdout.flush()
+    def downloadFiles(self, files, jobs):
+        """
+        Downloads a list of (item, dstfile) using jobs parallel downloads,
+        does NOT create folder structure!
+        """
+        def fetch(job):
+            data = self.fetchFile(job[0], job[1])
+            if data is None:
+                return None
+            return data["size"]
+
+        self.conn.setConcurrency(jobs)
+        start = time.time()
+        failed = 0
+        size = 0
+        for job, result in runParallel(fetch, files, jobs):
+            if result is None:
+                print('Downloading "%s" ... Failed' % job[1])
+                self.failed = True
+                failed += 1
+            else:
+                print('Downloading "%s" ... Done (%d bytes)' % (job[1], result))
+                size += result
+        self.applyLoaded()
+        print("Downloaded " + transferSummary(len(files), failed, size, time.time() - start))
+        return failed == 0
 
+    def updateFile(self, item, filename):
+        """
+        Replaces the contents of an existing file, returns the result of the
+        compile or None. May be used from any thread (see getContents).
+        """
         with open(filename, 'rb') as f:
             data = f.read()
 
         result = None
+        contents = self.getContents(item)
         if item["type"] == 'sa':
-            contents = self.conn.getSmartAppDetails(item["parent"])
-            result = self.conn.updateSmartAppItem(contents["details"], item["parent"], item["uuid"], data)
+            result = self.conn.updateSmartAppItem(contents, item["parent"], item["uuid"], data)
         elif item["type"] == 'dth':
-            contents = self.conn.getDeviceTypeDetails(item["parent"])
-            result = self.conn.updateDeviceTypeItem(contents["details"], item["parent"], item["uuid"], data)
-        if result and not result["errors"] and not result["output"]:
-            print("OK")
-        else:
-            print("Failed")
+            result = self.conn.updateDeviceTypeItem(contents, item["parent"], item["uuid"], data)
         return result
 
-    def uploadFile(self, item, filename, kind, path):
-        """ Uploads a new file to the server """
-        sys.stdout.write('Uploading "%s" ... ' % filename)
-        sys.stdout.flush()
+    def getIds(self, item):
+        """ Returns the ids needed to upload to the SA/DTH item belongs to """
+        if item["type"] == 'sa':
+            return self.conn.getSmartAppIds(item["parent"])
+        elif item["type"] == 'dth':
+            return self.conn.getDeviceTypeIds(item["parent"])
+        return None
 
+    def uploadFile(self, item, filename, kind, path):
+        """ Uploads a new file to the server, returns True on success """
         with open(filename, 'rb') as f:
             data = f.read()
 
         # Make sure we don't get a path in that thing
         filename = os.path.basename(filename)
-        result = None
-        if item["type"] == 'sa':
-            ids = self.conn.getSmartAppIds(item["parent"])
-            success = self.conn.uploadSmartAppItem(ids['versionid'], data, filename, path, kind)
-        elif item["type"] == 'dth':
-            ids = self.conn.getDeviceTypeIds(item["parent"])
-            success = self.conn.uploadDeviceTypeItem(ids['versionid'], data, filename, path, kind)
-        if success:
-            print("OK")
-        else:
-            print("Failed")
+        success = False
+        for attempt in range(2):
+            ids = self.getIds(item)
+            if ids is None:
+                return False
+            if item["type"] == 'sa':
+                success = self.conn.uploadSmartAppItem(ids['versionid'], data, filename, path, kind)
+            elif item["type"] == 'dth':
+                success = self.conn.uploadDeviceTypeItem(ids['versionid'], data, filename, path, kind)
+            if success:
+                break
+            # Might have been published elsewhere, which gives it a new version id
+            self.conn.forgetIds(item["parent"])
         return success
 
     def deleteFile(self, item):
         sys.stdout.write('Deleting file "%s" ... ' % os.path.basename(item['name']))
         sys.stdout.flush()
+        res = False
         if item["type"] == 'sa':
-            self.conn.deleteSmartAppItem(item['parent'], item['uuid'])
+            res = self.conn.deleteSmartAppItem(item['parent'], item['uuid'])
         elif item['type'] == 'dth':
-            self.conn.deleteDeviceTypeItem(item['parent'], item['uuid'])
-        print("OK")
+            res = self.conn.deleteDeviceTypeItem(item['parent'], item['uuid'])
+        if res:
+            self.invalidate(item['parent'])
+            print("OK")
+        else:
+            print("Failed")
+            self.failed = True
+        return res
 
     def deleteModule(self, item):
         sys.stdout.write('Deleting module "%s" ... ' % os.path.basename(item['name']))
@@ -292,9 +731,11 @@ class ConsoleAccess(cmd.Cmd):
         elif item['type'] == 'dth':
             res = self.conn.deleteDeviceType(item['parent'])
         if res:
+            self.cache.invalidate(item['parent'])
             print("OK")
         else:
             print("Failed")
+            self.failed = True
         return res
 
     def createModule(self, kind, filename):
@@ -314,6 +755,7 @@ class ConsoleAccess(cmd.Cmd):
             print("OK")
         else:
             print("Failed")
+            self.failed = True
         return result
 
     def publishModule(self, module):
@@ -328,6 +770,7 @@ class ConsoleAccess(cmd.Cmd):
             print("OK")
         else:
             print("Failed")
+            self.failed = True
         return result
 
     def do_pwd(self, line):
@@ -343,6 +786,7 @@ class ConsoleAccess(cmd.Cmd):
         cwd = self.resolvePath(line)
         if cwd is None:
             print('Path not found: "%s"' % line)
+            self.failed = True
         else:
             self.cwd = cwd
             self.updatePrompt()
@@ -358,22 +802,17 @@ class ConsoleAccess(cmd.Cmd):
 
         if cwd is None:
             print('Path not found: "%s"' % line)
+            self.failed = True
             return
 
         # See if we need to load something from the server
         self.loadFromServer(cwd)
 
-        # Iterate through tree, print all that matches
-        paths = self.splitPath(cwd)
-
-        for t in self.tree:
-            if t.startswith(cwd + "/"):
-                parts = self.splitPath(t)
-                filename = parts[len(paths)]
-                info = {"name" : filename,
-                        "dir" : self.tree[cwd + "/" + filename]["dir"]
-                        }
-                folderinfo.append(info)
+        for filename in self.tree.listDir(cwd):
+            info = {"name" : filename,
+                    "dir" : self.tree[cwd + "/" + filename]["dir"]
+                    }
+            folderinfo.append(info)
 
         self.printFolderInfo(folderinfo)
 
@@ -386,9 +825,65 @@ class ConsoleAccess(cmd.Cmd):
         for v in self.tree.values():
             if line == "" or line in repr(v):
                 print(repr(v))
+        rss = getRss()
+        print("%d nodes using %d KB, process using %s KB" % (len(self.tree), self.tree.getMemoryUsage() / 1024, "?" if rss is None else rss / 1024))
+
+    def do_stats(self, line):
+        """ Shows the number, timing and size of the requests made this session. Use "stats reset" to start over """
+        if line == "reset":
+            self.conn.trace.reset()
+            return
+        print(self.conn.trace.formatSummary())
+
+    def planGet(self, path, dstdir, jobs=1):
+        """
+        Walks the tree below path breadth first, loading the contents of
+        every SA/DTH on the way exactly once. Returns the local directories
+        to create and the files to download as (item, dstfile), relative to
+        dstdir. With more than one job, the contents of all SA/DTH on the
+        same level are loaded in parallel.
+        """
+        dirs = []
+        files = []
+        level = [path]
+        while level:
+            if jobs > 1:
+                self.prefetchItems(level, jobs)
+            below = []
+            for current in level:
+                node = self.tree[current]
+                dstfile = dstdir + "/" + current[len(path)+1:]
+                if not node["dir"]:
+                    files.append((node, dstfile))
+                    continue
+                if node["stale"]:
+                    self.loadFromServer(current)
+                dirs.append(dstfile)
+                for name in self.tree.listDir(current):
+                    below.append(current + "/" + name)
+            level = below
+        return dirs, files
+
+    def prefetchItems(self, paths, jobs):
+        """ Loads the contents of the not yet loaded SA/DTH among paths into the cache """
+        entries = []
+        for p in paths:
+            entry = self.tree[p]
+            if entry["dir"] and entry["stale"] and entry["parent"]:
+                entries.append(entry)
+        if len(entries) > 1:
+            self.conn.setConcurrency(jobs)
+            # The workers only fill the cache, the tree is only touched from this thread
+            for entry, data in runParallel(lambda e: self.cache.get(e["type"], e["parent"], False), entries, jobs):
+                if data is not None:
+                    self.bundleLoaded(entry["type"], entry["parent"], data)
 
     def do_get(self, line):
-        """ Downloads a file or directory """
+        """ Downloads a file or directory. Use "get -j N <directory>" to download N files in parallel """
+        jobs, line = parseJobs(line)
+        if line == "":
+            self.error("Need file or directory name")
+            return
         if line[0] == "/":
             filename = line
         else:
@@ -401,44 +896,24 @@ class ConsoleAccess(cmd.Cmd):
             self.resolvePath(path)
 
         if filename not in self.tree:
-            print('ERROR: No such file "%s"' % filename)
+            self.error('No such file "%s"' % filename)
             return
         item = self.tree[filename]
         if item["dir"]:
             self.clearCache()
-            parentdir = os.path.basename(item['name'])
             print('Downloading directory "%s"' % line)
-            # Time to traverse our tree and show what we WOULD be downloading...
-            size = 0
-            processed = []
-            while len(self.tree) != size:
-                size = len(self.tree)
-                for i in self.tree:
-                    if i in processed:
-                        continue
-
-                    if i.startswith(item["name"]):
-                        self.resolvePath(i)
-                        # Restart if tree changes
-                        if len(self.tree) != size:
-                            break
-                        dstfile = parentdir + '/' + i[len(filename)+1:]
-                        if self.tree[i]["dir"]:
-                            try:
-                                os.makedirs(dstfile)
-                            except:
-                                pass
-                        else:
-                            try:
-                                d = os.path.dirname(dstfile)
-                                os.makedirs(d)
-                            except:
-                                pass
-                            if not self.downloadFile(self.tree[i], dstfile, cache=True):
-                                self.clearCache()
-                                return
-                        processed.append(i)
-            self.clearCache()
+            dirs, files = self.planGet(filename, os.path.basename(item['name']), jobs)
+            for d in dirs:
+                try:
+                    os.makedirs(d)
+                except:
+                    pass
+            if jobs > 1:
+                self.downloadFiles(files, jobs)
+            else:
+                for f in files:
+                    if not self.downloadFile(f[0], f[1]):
+                        break
             return
         else:
             dstfile = os.path.basename(filename)
@@ -450,18 +925,18 @@ class ConsoleAccess(cmd.Cmd):
             try:
                 os.chdir(line)
             except:
-                print("ERROR: Invalid directory")
+                self.error("Invalid directory")
         print('Current local directory: "%s"' % os.getcwd())
 
     def do_lmkdir(self, line):
         """ Creates a directory locally """
         if line == "":
-            print("ERROR: Need directory name")
+            self.error("Need directory name")
             return
         try:
             os.mkdir(line)
         except:
-            print("ERROR: Couldn't create \"%s\"" % line)
+            self.error("Couldn't create \"%s\"" % line)
 
     def do_lls(self, line):
         """ List the files in the current local directory """
@@ -475,7 +950,7 @@ class ConsoleAccess(cmd.Cmd):
         try:
             data = os.listdir(cwd)
         except:
-            print("ERROR: Invalid directory")
+            self.error("Invalid directory")
             return
 
         folderinfo = []
@@ -487,16 +962,18 @@ class ConsoleAccess(cmd.Cmd):
 
         self.printFolderInfo(folderinfo)
 
-    def put(self, filename, dest):
+    def planPut(self, filename, dest):
+        """
+        Works out what it takes to put the local file filename in the folder
+        dest: either an "update" of the existing file or an "upload" of a new
+        one with the UPLOAD_TYPE and subpath it goes in. Returns the job for
+        putFiles or None if it can't be done.
+        """
         # Make sure the file exists
-        dstfile = None
-        srcfile = None
-        if os.path.exists(filename) and os.path.isfile(filename):
-            dstfile = os.path.basename(filename)
-            srcfile = filename
-        else:
-            print("ERROR: \"%s\" does not exist" % line)
-            return
+        if not os.path.isfile(filename):
+            self.error("\"%s\" does not exist" % filename)
+            return None
+        dstfile = os.path.basename(filename)
 
         # Find out if the user is allowed to upload here
         if dest != "":
@@ -506,58 +983,108 @@ class ConsoleAccess(cmd.Cmd):
 
         # The simple case...
         if dst is None or dst["parent"] == None:
-            print("ERROR: You don't have permission to upload here")
-            return
+            self.error("You don't have permission to upload here")
+            return None
 
         # Get the base directory and details
-        cwd = dest
-        while self.tree[cwd]["parent"]:
-            prev = cwd
-            cwd = self.getParent(cwd)
-        base = self.tree[prev]
+        base = self.tree[self.getModule(dest)]
         dstpath = (dest + '/')[len(base["name"])+1:]
+        job = {"src" : filename, "name" : dest + '/' + dstfile, "base" : base}
+
+        if job["name"] in self.tree:
+            job["action"] = "update"
+            job["item"] = self.tree[job["name"]]
+            return job
 
         # We should NOT allow upload in the base directory of a DTH/SA
         # unless it overwrites the existing groovy file
-        if (dest + '/' + dstfile) not in self.tree:
-            if dstpath == "":
-                print("ERROR: You can only upload the original groovy file here")
+        if dstpath == "":
+            self.error("You can only upload the original groovy file here")
+            return None
+
+        # TIme to figure out what type it is
+        parts = self.splitPath(dstpath)
+        kind = None
+        for k,v in self.conn.UPLOAD_TYPE.iteritems():
+            if v == parts[0]:
+                kind = k
+                break
+        if not kind:
+            self.error("You don't have permission to upload here")
+            return None
+        job["action"] = "upload"
+        job["kind"] = kind
+        job["path"] = "/".join(parts[1:])
+        return job
+
+    def pushFile(self, job):
+        """ Carries out a job made by planPut, see putFiles """
+        if job["action"] == "update":
+            return self.updateFile(job["item"], job["src"])
+        return self.uploadFile(job["base"], job["src"], job["kind"], job["path"])
+
+    def printCompileResult(self, result):
+        if "errors" in result and result["errors"]:
+            print("Errors:")
+            for e in result["errors"]:
+                print("  " + e)
+        if "output" in result and result["output"]:
+            print("Details:")
+            for o in result["output"]:
+                print("  " + o)
+
+    def refreshModule(self, module):
+        """ Reloads the contents of the SA/DTH in the folder module from the server """
+        entry = self.tree[module]
+        self.invalidate(entry["parent"])
+        data = self.cache.get(entry["type"], entry["parent"])
+        if data is not None:
+            self.syncItems(module, data)
+
+    def putFiles(self, plan, jobs=1):
+        """
+        Uploads or updates the files in plan (see planPut), jobs at a time.
+        Every SA/DTH which got new files is refreshed once at the end.
+        Returns True if all went well.
+        """
+        # Get the ids needed for uploading up front, once per SA/DTH
+        modules = {}
+        for job in plan:
+            if job["action"] == "upload" and job["base"]["name"] not in modules:
+                modules[job["base"]["name"]] = True
+                self.getIds(job["base"])
+
+        self.conn.setConcurrency(jobs)
+        start = time.time()
+        failed = 0
+        size = 0
+        for job, result in runParallel(self.pushFile, plan, jobs):
+            if job["action"] == "update":
+                ok = result is not None and not result["errors"] and not result["output"]
             else:
-                # TIme to figure out what type it is
-                parts = self.splitPath(dstpath)
-                kind = None
-                for k,v in self.conn.UPLOAD_TYPE.iteritems():
-                    if v == parts[0]:
-                        kind = k
-                        break
-                if not kind:
-                    print("ERROR: You don't have permission to upload here")
-                    return
-                path = ""
-                for p in parts[1:]:
-                    path += '/' + p
-                if path != "":
-                    path = path[1:]
-                result = self.uploadFile(base, srcfile, kind, path)
-                if result:
-                    # We need to refresh this branch
-                    base["stale"] = True
-                    self.resolvePath(dest)
-        else:
-            dst = self.tree[(dest + '/' + dstfile)]
-            result = self.updateFile(dst, srcfile)
-            if result is None:
-                print("Internal error")
+                ok = result is True
+            print('%s "%s" ... %s' % ("Updating" if job["action"] == "update" else "Uploading", job["src"], "OK" if ok else "Failed"))
+            if job["action"] == "update" and result is not None:
+                self.printCompileResult(result)
+            if ok:
+                size += os.path.getsize(job["src"])
             else:
-                if "errors" in result and result["errors"]:
-                    print("Errors:")
-                    for e in result["errors"]:
-                        print("  " + e)
-                if "output" in result and result["output"]:
-                    print("Details:")
-                    for o in result["output"]:
-                        print("  " + o)
-        return
+                self.failed = True
+                failed += 1
+
+        self.applyLoaded()
+        for module in modules:
+            self.refreshModule(module)
+        if len(plan) > 1:
+            print("Uploaded " + transferSummary(len(plan), failed, size, time.time() - start))
+        return failed == 0
+
+    def put(self, filename, dest):
+        """ Uploads or updates a single file in the folder dest, returns True on success """
+        job = self.planPut(filename, dest)
+        if job is None:
+            return False
+        return self.putFiles([job])
 
     def do_put(self, line):
         """ Upload a file to the current directory, overwrite if already exists """
@@ -569,10 +1096,10 @@ class ConsoleAccess(cmd.Cmd):
             return
         filename = self.cwd + '/' + line
         if filename not in self.tree:
-            print("ERROR: No such file \"%s\"" % filename)
+            self.error("No such file \"%s\"" % filename)
             return
         if self.tree[filename]["dir"]:
-            print("ERROR: Can't delete directory")
+            self.error("Can't delete directory")
             return
 
         cwd = self.cwd
@@ -582,10 +1109,10 @@ class ConsoleAccess(cmd.Cmd):
         base = self.tree[prev]
         dstpath = (self.cwd + '/')[len(base["name"])+1:]
         if dstpath == "":
-            print("ERROR: This would delete the entire module, aborting")
+            self.error("This would delete the entire module, aborting")
             return
-        self.deleteFile(self.tree[filename])
-        self.tree.pop(filename, None)
+        if self.deleteFile(self.tree[filename]):
+            self.tree.pop(filename, None)
 
     def do_mrm(self, line):
         """ Deletes zero or more files from current directory using pattern matching """
@@ -593,14 +1120,10 @@ class ConsoleAccess(cmd.Cmd):
             return
 
         # Build a list of files
-        paths = self.splitPath(self.cwd)
         lst = []
-        for t in self.tree:
-            if t.startswith(self.cwd + "/"):
-                parts = self.splitPath(t)
-                filename = parts[len(paths)]
-                if not self.tree[self.cwd + "/" + filename]["dir"] and filename not in lst and fnmatch.fnmatch(filename, line):
-                    lst.append(filename)
+        for filename in self.tree.listDir(self.cwd):
+            if not self.tree[self.cwd + "/" + filename]["dir"] and fnmatch.fnmatch(filename, line):
+                lst.append(filename)
         if len(lst) == 0:
             return
 
@@ -613,14 +1136,14 @@ class ConsoleAccess(cmd.Cmd):
             return
         filename = self.cwd + '/' + line
         if filename not in self.tree:
-            print("ERROR: No such module \"%s\"" % filename)
+            self.error("No such module \"%s\"" % filename)
             return
         if self.tree[filename]['parent'] is None:
-            print("ERROR: Not a module \"%s\"" % filename)
+            self.error("Not a module \"%s\"" % filename)
             return
         parent = self.getParent(filename)
         if self.tree[parent]['parent'] is not None:
-            print("ERROR: Not a module \"%s\"" % filename)
+            self.error("Not a module \"%s\"" % filename)
             return
         sys.stderr.write('WARNING! This will delete the module "%s", are you sure? (yes/NO) ' % filename)
         sys.stderr.flush()
@@ -628,19 +1151,16 @@ class ConsoleAccess(cmd.Cmd):
         if choice == "yes":
             if self.deleteModule(self.tree[filename]):
                 # Remove ALL references
-                lst = []
-                for k in self.tree:
-                    if k.startswith(filename + '/') or k == filename:
-                        lst.append(k)
-                for l in lst:
-                    self.tree.pop(l)
+                if self.diskcache:
+                    self.diskcache.dropModule(self.tree[filename]['type'], self.tree[filename]['parent'])
+                self.tree.removeTree(filename)
         else:
             print("Operation aborted")
 
     def do_create(self, line):
         """ Creates a new SmartApp or DeviceTypeHandler """
         if line == "" or not os.path.exists(line):
-            print("ERROR: You must provide groovy file to create new module")
+            self.error("You must provide groovy file to create new module")
             return
         filename = line
         kind = None
@@ -649,21 +1169,21 @@ class ConsoleAccess(cmd.Cmd):
         elif self.cwd.startswith('/devicetypes'):
             kind = 'dth'
         if kind is None:
-            print("ERROR: You cannot create a new module here")
+            self.error("You cannot create a new module here")
             return
         result = self.createModule(kind, filename)
         if result:
-            # We need to invalidate the cache so user sees the new module
+            # The prefetched list (if any) is too old to have the new module
+            self.prefetched.pop(kind, None)
             if kind == 'sa':
-                self.tree['/smartapps']['stale'] = True
+                self.syncList('/smartapps')
             else:
-                self.tree['/devicetypes']['stale'] = True
-            self.resolvePath(self.cwd)
+                self.syncList('/devicetypes')
 
     def do_publish(self, line):
         """ Publishes changes to a SmartApp or DeviceTypeHandler """
         if line == "":
-            print("ERROR: You must provide module name")
+            self.error("You must provide module name")
             return
         if line == '.':
             # Trick, if you stand inside the module, this will publish it
@@ -672,7 +1192,7 @@ class ConsoleAccess(cmd.Cmd):
             module = self.cwd + '/' + line
 
         if module not in self.tree or self.tree[module]["parent"] is None:
-            print("ERROR: Cannot find module \"%s\"" % line)
+            self.error("Cannot find module \"%s\"" % line)
             return
 
         while self.tree[module]["parent"]:
@@ -688,7 +1208,7 @@ class ConsoleAccess(cmd.Cmd):
 
     def mkdir(self, line):
         if line == "":
-            print("ERROR: Need name for new directory")
+            self.error("Need name for new directory")
             return
         if '/' in line or '.' in line:
             base = os.path.dirname(line)
@@ -702,7 +1222,7 @@ class ConsoleAccess(cmd.Cmd):
             path = self.cwd
 
         if path is None:
-            print('ERROR: Invalid path "%s"' % line)
+            self.error('Invalid path "%s"' % line)
             return False
         else:
             line = new
@@ -714,7 +1234,7 @@ class ConsoleAccess(cmd.Cmd):
 
         # The simple case...
         if dst is None or dst["parent"] == None:
-            print("ERROR: You don't have permission to create a directory here")
+            self.error("You don't have permission to create a directory here")
             return False
 
         # Get the base directory and details
@@ -725,21 +1245,21 @@ class ConsoleAccess(cmd.Cmd):
         base = self.tree[prev]
         dstpath = (path + '/')[len(base["name"])+1:]
         if dstpath == '':
-            print("ERROR: You don't have permission to create a directory here")
+            self.error("You don't have permission to create a directory here")
             return False
 
         filename = path + '/' + line
-        self.tree[filename] = {"name" : filename, "dir" : True, "parent" : base["parent"], "uuid" : None, "type" : base['type'], "stale" : False}
+        self.tree.add(filename, True)
         return True
 
     def do_mkdir(self, line):
         """ Create a directory. Please note that if you never place any files in this directory, it will disappear """
         self.mkdir(line)
 
-    def recursivePut(self, srcpath, dstpath):
+    def planRecursivePut(self, srcpath, dstpath, plan):
         """
-        Will go through the directory and upload all files found. Any directory will be
-        created and uploaded recursively.
+        Will go through the directory and plan the upload of all files found.
+        Any directory will be created and planned recursively.
         """
         if not self.mkdir(dstpath):
             print("Unable to create directory, skipping \"%s\"" % srcpath)
@@ -748,12 +1268,18 @@ class ConsoleAccess(cmd.Cmd):
         for f in files:
             filename = srcpath + '/' + f
             if os.path.isfile(filename):
-                self.put(filename, dstpath)
+                job = self.planPut(filename, dstpath)
+                if job is not None:
+                    plan.append(job)
             elif os.path.isdir(filename):
-                self.recursivePut(filename, dstpath + '/' + f)
+                self.planRecursivePut(filename, dstpath + '/' + f, plan)
 
     def do_mput(self, line):
-        """ Uploads one or more files using wildcards to the current directory. If given '-r' as the first argument, it will recurse through ALL subfolders found """
+        """
+        Uploads one or more files using wildcards to the current directory. If given '-r' as the first argument,
+        it will recurse through ALL subfolders found. Use "mput -j N ..." to upload N files in parallel
+        """
+        jobs, line = parseJobs(line)
         if line == "":
             return
         recursive = False
@@ -770,14 +1296,83 @@ class ConsoleAccess(cmd.Cmd):
         files = glob.glob(line)
         if len(files) == 0:
             return
+        plan = []
         for f in files:
             if os.path.isfile(f):
-                self.put(f, self.cwd)
+                job = self.planPut(f, self.cwd)
+                if job is not None:
+                    plan.append(job)
             elif os.path.isdir(f):
                 if recursive:
-                    self.recursivePut(f, self.cwd + '/' + f)
+                    self.planRecursivePut(f, self.cwd + '/' + f, plan)
                 else:
                     print('Skipping "%s" since it\'s a directory' % f)
+        if plan:
+            self.putFiles(plan, jobs)
+
+    def do_sync(self, line):
+        """
+        Pushes new and changed files from a local directory (default is the current one) to the SmartApp
+        or DeviceTypeHandler you're in. Use "-n" to only show what would be done and "-d" to also delete
+        files which only exist on the server. Usage: sync [-n] [-d] [<local directory>]
+        """
+        dryrun = False
+        delete = False
+        directory = "."
+        for arg in line.split():
+            if arg in ["-n", "--dry-run"]:
+                dryrun = True
+            elif arg in ["-d", "--delete"]:
+                delete = True
+            else:
+                directory = arg
+        if not os.path.isdir(directory):
+            self.error('No such local directory "%s"' % directory)
+            return
+
+        module = self.getModule(self.cwd)
+        if module is None:
+            self.error("You need to be inside a SmartApp or DeviceTypeHandler")
+            return
+        entry = self.tree[module]
+        details = self.cache.get(entry["type"], entry["parent"])
+        sync = BundleSync(self.conn, entry["type"], entry["parent"], directory)
+        if not sync.sync(details, delete, dryrun):
+            self.failed = True
+        if not dryrun:
+            # Show the changes
+            self.refreshModule(module)
+
+    def do_watch(self, line):
+        """
+        Pushes files of a local directory (default is the current one) to the SmartApp or DeviceTypeHandler
+        you're in as soon as they're saved, until you press CTRL-C. Use "-p" to publish after every push,
+        "-d" to also delete files on the server which are deleted locally. Usage: watch [-p] [-d] [<local directory>]
+        """
+        publish = False
+        delete = False
+        directory = "."
+        for arg in line.split():
+            if arg in ["-p", "--publish"]:
+                publish = True
+            elif arg in ["-d", "--delete"]:
+                delete = True
+            else:
+                directory = arg
+        if not os.path.isdir(directory):
+            self.error('No such local directory "%s"' % directory)
+            return
+
+        module = self.getModule(self.cwd)
+        if module is None:
+            self.error("You need to be inside a SmartApp or DeviceTypeHandler")
+            return
+        entry = self.tree[module]
+        sync = BundleSync(self.conn, entry["type"], entry["parent"], directory)
+        sync.details = self.cache.get(entry["type"], entry["parent"])
+        BundleWatch(sync, createWatcher(directory), publish=publish, delete=delete).run()
+        # Show the changes
+        self.refreshModule(module)
 
     def do_EOF(self, line):
         """ Exits the console """
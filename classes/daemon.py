@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import errno
+import signal
+import socket
+import traceback
+import StringIO
+
+from classes.console import ConsoleAccess
+from classes.diskcache import getCacheFile
+
+# These actions may ask the user questions, so they're only forwarded when
+# there is no terminal to ask on (ie, input is piped)
+INTERACTIVE_ACTIONS = ["console", "delete"]
+
+# These actions run until interrupted, they'd keep the daemon from doing
+# anything else, so they're never forwarded
+LOCAL_ACTIONS = ["daemon", "watch"]
+
+# These change SA/DTH behind the back of the console kept by the daemon
+CHANGING_ACTIONS = ["create", "upload", "update", "delete", "sync"]
+
+def getSocketPath(server, username):
+    """ Returns where the daemon for this server and user listens """
+    return getCacheFile("daemon", server, username, ext="sock")
+
+class StreamWriter(object):
+    """ File like object which forwards everything written to the client """
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+
+    def write(self, data):
+        if not data:
+            return
+        if isinstance(data, str):
+            data = data.decode("utf-8", "replace")
+        try:
+            self.conn.sendall(json.dumps({self.name : data}) + "\n")
+        except socket.error:
+            # Client is gone, nothing we can do about it
+            pass
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+class StShellDaemon(object):
+    """
+    Keeps one logged in STServer, its connections and a console around and
+    runs the commands forwarded by stshell (see forwardCommand) over a Unix
+    socket. Commands are run one at a time.
+    """
+    def __init__(self, srv, parser, runner, diskcache, path):
+        self.srv = srv
+        self.parser = parser
+        self.runner = runner
+        self.diskcache = diskcache
+        self.path = path
+        self.console = ConsoleAccess()
+        self.console.setConnection(srv, diskcache)
+
+    def bind(self):
+        """ Creates the socket, replacing one left behind by a daemon which died """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.makedirs(os.path.dirname(self.path), 0700)
+        except:
+            pass
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                probe.close()
+                print("ERROR: A daemon is already running on %s" % self.path)
+                return None
+            except socket.error:
+                os.remove(self.path)
+        sock.bind(self.path)
+        os.chmod(self.path, 0600)
+        sock.listen(5)
+        return sock
+
+    def serve(self):
+        sock = self.bind()
+        if sock is None:
+            return False
+
+        # Raising here would end up in handle() as the outcome of the command
+        # being run, so the command is finished and the loop stops after it
+        self.stopping = False
+        def terminate(signum, frame):
+            self.stopping = True
+        signal.signal(signal.SIGTERM, terminate)
+
+        print("Daemon listening on %s" % self.path)
+        sys.stdout.flush()
+        try:
+            while not self.stopping:
+                try:
+                    conn, _ = sock.accept()
+                except socket.error as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                try:
+                    self.handle(conn)
+                finally:
+                    conn.close()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            os.remove(self.path)
+        return True
+
+    def forgetChanges(self, cmdline):
+        """ Makes the console forget about the SA/DTH (or list of them) changed by a command """
+        if cmdline.action not in CHANGING_ACTIONS:
+            return
+        kind = 'sa'
+        if cmdline.KIND == "DTH":
+            kind = 'dth'
+        if cmdline.action == "create":
+            self.console.forgetList(kind)
+            return
+        self.console.forgetModule(cmdline.UUID)
+        if cmdline.action == "delete" and cmdline.ITEM is None:
+            self.console.forgetList(kind)
+
+    def handle(self, conn):
+        """ Runs one command, sending its output and exit status back to the client """
+        try:
+            request = json.loads(conn.makefile("rb").readline())
+        except ValueError:
+            return
+
+        # JSON gives us unicode, the commandline is made of plain strings
+        # (type=str.upper won't take anything else)
+        argv = [arg.encode("utf-8") for arg in request["argv"]]
+        cwd = request["cwd"].encode("utf-8")
+        stdin = (request.get("stdin") or u"").encode("utf-8")
+
+        status = 0
+        saved = (sys.stdin, sys.stdout, sys.stderr, os.getcwd())
+        sys.stdin = StringIO.StringIO(stdin)
+        sys.stdout = StreamWriter(conn, "out")
+        sys.stderr = StreamWriter(conn, "err")
+        try:
+            os.chdir(cwd)
+            cmdline = self.parser.parse_args(argv)
+            if cmdline.action == "daemon":
+                print("ERROR: Daemon is already running")
+                status = 255
+            elif cmdline.action in LOCAL_ACTIONS:
+                print("ERROR: %s can't be run by the daemon" % cmdline.action)
+                status = 255
+            else:
+                if cmdline.action == "console":
+                    self.console.stdin = sys.stdin
+                    self.console.stdout = sys.stdout
+                    self.console.use_rawinput = False
+                    self.console.cwd = ""
+                    self.console.updatePrompt()
+                try:
+                    self.runner(self.srv, cmdline, self.diskcache, self.console)
+                finally:
+                    self.forgetChanges(cmdline)
+        except SystemExit as e:
+            if e.code is None:
+                status = 0
+            elif isinstance(e.code, int):
+                status = e.code
+            else:
+                print(e.code)
+                status = 1
+        except Exception:
+            sys.stderr.write(traceback.format_exc())
+            status = 255
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = saved[0:3]
+            os.chdir(saved[3])
+
+        try:
+            conn.sendall(json.dumps({"exit" : status}) + "\n")
+        except socket.error:
+            pass
+
+def forwardCommand(path, argv, stdin=None):
+    """
+    Runs the command described by argv in the daemon listening on path,
+    printing its output. Returns the exit status or None if no daemon runs.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return None
+
+    request = {"argv" : argv, "cwd" : os.getcwd(), "stdin" : stdin}
+    sock.sendall(json.dumps(request) + "\n")
+    status = 255
+    for line in sock.makefile("rb"):
+        msg = json.loads(line)
+        if "out" in msg:
+            sys.stdout.write(msg["out"].encode("utf-8"))
+            sys.stdout.flush()
+        elif "err" in msg:
+            sys.stderr.write(msg["err"].encode("utf-8"))
+            sys.stderr.flush()
+        elif "exit" in msg:
+            status = msg["exit"]
+    sock.close()
+    return status
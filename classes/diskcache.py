@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+def getCacheDir():
+    """ Returns the directory where stshell keeps its cached data """
+    base = os.environ.get("XDG_CACHE_HOME", "")
+    if base == "":
+        base = os.path.expanduser("~/.cache")
+    return os.path.join(base, "stshell")
+
+def getCacheFile(kind, server, username, path=None, ext="json"):
+    """ Returns the name of the file holding kind of data for this server and user """
+    if path is None:
+        path = getCacheDir()
+    key = hashlib.sha1("%s\0%s" % (server, username)).hexdigest()
+    return os.path.join(path, "%s-%s.%s" % (kind, key, ext))
+
+def loadJson(filename):
+    """ Returns the contents of a JSON file or None if it can't be loaded """
+    try:
+        with open(filename, "r") as f:
+            return json.load(f)
+    except:
+        return None
+
+def saveJson(filename, data):
+    """ Atomically writes data to a JSON file which only the user can read """
+    try:
+        os.makedirs(os.path.dirname(filename), 0700)
+    except:
+        pass
+    tmp = "%s.%d.tmp" % (filename, os.getpid())
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        if os.name == "nt" and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmp, filename)
+    except (IOError, OSError) as e:
+        print("WARNING: Unable to save \"%s\" (%s)" % (filename, e))
+        return False
+    return True
+
+class MetadataCache(object):
+    """
+    Stores the lists of SmartApps/DeviceTypes and the resource lists of
+    bundles on disk, so a new session can show the tree without asking
+    the server for everything again. One file is kept per server and user.
+
+    Changes may come from any thread. They're only kept in memory until
+    save() is called, so loading many bundles writes the file once rather
+    than once per bundle.
+    """
+    VERSION = 1
+
+    # Entries older than this (in seconds) are ignored
+    MAX_AGE = 7 * 24 * 3600
+
+    def __init__(self, server, username, path=None, maxage=MAX_AGE):
+        self.filename = getCacheFile("metadata", server, username, path)
+        self.maxage = maxage
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.data = {"version" : MetadataCache.VERSION, "lists" : {}, "bundles" : {}}
+        self.load()
+
+    def load(self):
+        data = loadJson(self.filename)
+        if data is not None and data.get("version") == MetadataCache.VERSION:
+            self.data = data
+
+    def save(self):
+        """ Writes the cache to disk if anything changed since the last time """
+        with self.lock:
+            if not self.dirty:
+                return True
+            self.dirty = False
+            return saveJson(self.filename, self.data)
+
+    def isFresh(self, entry):
+        return entry is not None and time.time() - entry["time"] < self.maxage
+
+    def getList(self, kind):
+        """ Returns the cached list of SmartApps ('sa') or DeviceTypes ('dth') """
+        entry = self.data["lists"].get(kind)
+        if not self.isFresh(entry):
+            return None
+        return entry["data"]
+
+    def setList(self, kind, data):
+        with self.lock:
+            self.data["lists"][kind] = {"time" : time.time(), "data" : data}
+            self.dirty = True
+
+    def dropList(self, kind):
+        with self.lock:
+            if self.data["lists"].pop(kind, None) is not None:
+                self.dirty = True
+
+    def getBundle(self, uuid):
+        """ Returns the cached resource list of a bundle in the getFileDetails format """
+        entry = self.data["bundles"].get(uuid)
+        if not self.isFresh(entry):
+            return None
+        flat = {}
+        for k,v in entry["index"].iteritems():
+            flat[k] = v["path"] + "/" + v["filename"]
+        return {"details" : None, "flat" : flat, "index" : entry["index"]}
+
+    def setBundle(self, uuid, data):
+        with self.lock:
+            self.data["bundles"][uuid] = {"time" : time.time(), "index" : data["index"]}
+            self.dirty = True
+
+    def getRecentBundles(self, count):
+        """ Returns the uuids of the count bundles whose contents were loaded most recently """
+        with self.lock:
+            recent = sorted(self.data["bundles"].items(), key=lambda x: -x[1]["time"])
+        return [k for k,v in recent[:count] if self.isFresh(v)]
+
+    def dropBundle(self, uuid):
+        with self.lock:
+            if self.data["bundles"].pop(uuid, None) is not None:
+                self.dirty = True
+
+    def dropModule(self, kind, uuid):
+        """ Forgets a deleted SA/DTH entirely """
+        with self.lock:
+            self.data["bundles"].pop(uuid, None)
+            entry = self.data["lists"].get(kind)
+            if entry is not None and uuid in entry["data"]:
+                # Whoever got the list from getList may still be using it
+                data = dict(entry["data"])
+                del data[uuid]
+                self.data["lists"][kind] = {"time" : entry["time"], "data" : data}
+            self.dirty = True
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+
+from classes.parsing import sanitizeName
+from classes.diskcache import loadJson, saveJson
+from classes.parallel import transferSummary
+from classes.asyncserver import AsyncSTServer
+
+class Mirror(object):
+    """
+    Downloads every SmartApp and DeviceType into a local tree laid out like
+    the console (smartapps/<namespace>/<name>.src/...). Only items which are
+    new or may have changed since the last run are downloaded. Every item
+    is recorded in a journal as soon as it's stored, so an interrupted run
+    continues where it stopped.
+    """
+    STATE = ".stshell-mirror"
+    JOURNAL = ".stshell-mirror.journal"
+
+    def __init__(self, conn, dest, jobs=1):
+        self.conn = conn
+        self.dest = dest.rstrip("/")
+        self.jobs = jobs
+        self.statefile = os.path.join(dest, Mirror.STATE)
+        self.journalfile = os.path.join(dest, Mirror.JOURNAL)
+        self.state = loadJson(self.statefile)
+        if self.state is None:
+            self.state = {"items" : {}}
+
+    def listBundles(self, aconn):
+        """ Returns a list of (kind, uuid, path inside dest) of all SA/DTH, or None """
+        result = []
+        lists = [('sa', "smartapps", aconn.listSmartApps()), ('dth', "devicetypes", aconn.listDeviceTypes())]
+        for kind, base, pending in lists:
+            data = pending.get()
+            if data is None:
+                return None
+            for d in data.values():
+                path = "/%s/%s/%s.src" % (base, sanitizeName(d["namespace"]), sanitizeName(d["name"]))
+                result.append((kind, d["id"], path))
+        return result
+
+    def loadJournal(self):
+        """ Returns the items finished by an interrupted run, adding them to the state """
+        done = set()
+        try:
+            with open(self.journalfile, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line might be incomplete
+                        continue
+                    self.state["items"][entry["key"]] = entry["item"]
+                    done.add(entry["key"])
+        except IOError:
+            pass
+        return done
+
+    def isImmutable(self, info):
+        """
+        Images can't be edited on the server, only replaced by new ones, so
+        an image we already have can't have changed.
+        """
+        return (info["content"] or "").startswith("image/") or info["type"] == "IMAGE"
+
+    def plan(self, aconn, bundles, done, full):
+        """ Loads the contents of all bundles and returns the items which need downloading """
+        def load(bundle):
+            if bundle[0] == 'sa':
+                return self.conn.getSmartAppDetails(bundle[1])
+            return self.conn.getDeviceTypeDetails(bundle[1])
+
+        items = []
+        failed = 0
+        for bundle, data in aconn.imap(load, bundles):
+            if data is None:
+                print('ERROR: Unable to get contents of "%s"' % bundle[2])
+                failed += 1
+                continue
+            for itemid, info in data["index"].iteritems():
+                key = bundle[1] + "/" + itemid
+                name = bundle[2] + info["path"] + "/" + info["filename"]
+                if key in done:
+                    continue
+                known = self.state["items"].get(key)
+                if not full and known and known["file"] == name and self.isImmutable(info) and os.path.exists(self.dest + name):
+                    continue
+                items.append({"key" : key, "bundle" : bundle, "id" : itemid, "file" : name, "details" : data})
+        return items, failed
+
+    def fetch(self, item):
+        """ Downloads an item, only replacing the file if it differs from what we have. Returns (hash, size, changed) """
+        kind, uuid, path = item["bundle"]
+        filename = self.dest + item["file"]
+        known = self.state["items"].get(item["key"])
+        skiphash = None
+        if known and known["file"] == item["file"]:
+            skiphash = known["hash"]
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except:
+            pass
+        if kind == 'sa':
+            content = self.conn.downloadSmartAppItemToFile(uuid, item["details"], item["id"], filename, skiphash)
+        else:
+            content = self.conn.downloadDeviceTypeItemToFile(uuid, item["details"], item["id"], filename, skiphash)
+        if content is None:
+            return None
+        return content["hash"], content["size"], content["changed"]
+
+    def run(self, full=False):
+        """ Mirrors everything, returns True if all went well """
+        start = time.time()
+        done = self.loadJournal()
+        if done:
+            print("Resuming interrupted mirror, %d item(s) already done" % len(done))
+
+        with AsyncSTServer(self.conn, self.jobs) as aconn:
+            sys.stdout.write("Loading list of SmartApps and DeviceTypes ... ")
+            sys.stdout.flush()
+            bundles = self.listBundles(aconn)
+            if bundles is None:
+                print("Failed")
+                return False
+            print("%d found" % len(bundles))
+
+            items, failed = self.plan(aconn, bundles, done, full)
+            print("%d item(s) to check" % len(items))
+
+            try:
+                os.makedirs(self.dest)
+            except:
+                pass
+            changed = 0
+            size = 0
+            with open(self.journalfile, "a") as journal:
+                for item, result in aconn.imap(self.fetch, items):
+                    if result is None:
+                        print("  %s: Failed" % item["file"])
+                        failed += 1
+                        continue
+                    entry = {"file" : item["file"], "hash" : result[0]}
+                    self.state["items"][item["key"]] = entry
+                    journal.write(json.dumps({"key" : item["key"], "item" : entry}) + "\n")
+                    journal.flush()
+                    size += result[1]
+                    if result[2]:
+                        changed += 1
+                        print("  %s: Updated (%d bytes)" % (item["file"], result[1]))
+
+        print("%d item(s) changed, " % changed + transferSummary(len(items), failed, size, time.time() - start))
+        # Whatever failed isn't in the state, so it's retried next time
+        saveJson(self.statefile, self.state)
+        os.remove(self.journalfile)
+        return failed == 0
@@ -0,0 +1,37 @@
+import sys
+import traceback
+
+from multiprocessing.pool import ThreadPool
+
+def runParallel(func, items, jobs=1):
+    """
+    Calls func for every item, using up to jobs worker threads. Yields
+    (item, result) tuples in the order they complete. Should func raise,
+    the error is printed and None is yielded as the result.
+    """
+    def worker(item):
+        try:
+            return item, func(item)
+        except Exception:
+            sys.stderr.write("ERROR: %s" % traceback.format_exc())
+            return item, None
+
+    items = list(items)
+    if jobs <= 1 or len(items) < 2:
+        for i in items:
+            yield worker(i)
+        return
+
+    pool = ThreadPool(min(jobs, len(items)))
+    try:
+        for result in pool.imap_unordered(worker, items):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def transferSummary(files, failed, size, elapsed):
+    """ Returns a human readable summary of a transfer """
+    if elapsed <= 0:
+        elapsed = 0.001
+    return "%d file(s), %d failed, %d bytes in %.2fs (%.1f KB/s)" % (files, failed, size, elapsed, size / elapsed / 1024.0)
@@ -0,0 +1,159 @@
+import re
+
+# All patterns used to pick apart the WebIDE's pages and the user's input,
+# compiled once when the module is loaded instead of on every call.
+
+# Flash message the WebIDE shows when something was refused
+ERROR_MESSAGE = re.compile('\<div class=\"alert alert\-danger alert\-dismissible flash\"\>(.+?)\<\/div\>', re.MULTILINE|re.IGNORECASE|re.DOTALL)
+ERROR_MARKUP = re.compile('<[^>]+?>.*?</[^>]+?>')
+
+# Where the WebIDE redirects to after creating a SA/DTH
+EDITOR_LOCATION = {
+    "app" : re.compile('/ide/app/editor/([a-f0-9\-]+)', re.IGNORECASE),
+    "device" : re.compile('/ide/device/editor/([a-f0-9\-]+)', re.IGNORECASE)
+}
+
+# Start of the block holding the ids on the editor page of a SA/DTH
+IDE_INIT = re.compile('ST\.(App|Device)IDE\.init\(\{')
+APP_IDS = re.compile('ST\.AppIDE\.init\(\{.+?url: \'([^\']+)\',.+?websocket: \'([^\']+)\',.+?client: \'([^\']+)\',.+?id: \'([^\']+)\',.+?versionId: \'([^\']+)\',.+?state: \'([^\']+)\'', re.MULTILINE|re.IGNORECASE|re.DOTALL)
+DEVICE_IDS = re.compile('ST\.DeviceIDE\.init\(\{.+?url: \'([^\']+)\',.+?websocket: \'([^\']+)\',.+?client: \'([^\']+)\',.+?id: \'([^\']+)\'', re.MULTILINE|re.IGNORECASE|re.DOTALL)
+
+DASHES = re.compile('\-+')
+SLASHES = re.compile('/+')
+JOBS_OPTION = re.compile('-j\s*([0-9]+)\s+(.*)')
+CONFIG_LINE = re.compile('([^=]+)=(.+)')
+
+def extractErrorMessage(content):
+    """ Returns the error shown on a WebIDE page, or None if there is none """
+    m = ERROR_MESSAGE.search(content)
+    if m:
+        # Remove any tags
+        return ERROR_MARKUP.sub("", m.group(1)).strip()
+    return None
+
+def parseEditorLocation(kind, location):
+    """ Returns the id of the SA ("app") or DTH ("device") the editor at location is for """
+    m = EDITOR_LOCATION[kind].search(location)
+    if m:
+        return m.group(1)
+    return None
+
+def parseSmartAppIds(block):
+    """
+    ST.AppIDE.init({
+                        url: '/ide/app/',
+                        websocket: 'wss://ic.connect.smartthings.com:8443/',
+                        client: '1af9e4e7-9a2d-47a4-9edf-c9f326642489',
+                        id: '19d2016d-2337-46bc-ae0e-143e033d4a63',
+                        versionId: '5d01fb38-cd7f-48b3-be2f-2509efb09020',
+                        state: 'NOT_APPROVED'
+                    });
+    """
+    m = APP_IDS.search(block)
+    if m:
+        return {
+            "url" : m.group(1),
+            "websocket" : m.group(2),
+            "client" : m.group(3),
+            "id" : m.group(4),
+            "versionid" : m.group(5),
+            "state" : m.group(6)
+        }
+    return None
+
+def parseDeviceTypeIds(block):
+    m = DEVICE_IDS.search(block)
+    if m:
+        return {
+            "url" : m.group(1),
+            "websocket" : m.group(2),
+            "client" : m.group(3),
+            "id" : m.group(4),
+            "versionid" : m.group(4), # Same as Id for some reason
+            "state" : None
+        }
+    return None
+
+# There are only so many namespaces and names, but they're sanitized
+# twice for every SA/DTH each time the lists are loaded
+sanitized = {}
+
+def sanitizeName(name):
+    """Replaces invalid characters in the provided name"""
+    result = sanitized.get(name)
+    if result is None:
+        result = name
+        for f in ["/", "(", ")", " "]:
+            result = result.replace(f, "-")
+
+        # Get rid of multiple dashes in a row
+        result = DASHES.sub("-", result)
+        if result[-1:] == '-':
+            result = result[:-1]
+        result = sanitized[name] = result.lower()
+    return result
+
+def normalizePath(path):
+    """ Collapses repeated slashes in path """
+    return SLASHES.sub("/", path)
+
+def parseJobs(line):
+    """ Strips an optional "-j N" from the start of line, returns (jobs, line) """
+    m = JOBS_OPTION.match(line)
+    if m:
+        return max(1, int(m.group(1))), m.group(2)
+    return 1, line
+
+def parseConfigLine(line):
+    """ Splits a "key=value" line of ~/.stshell, returns (key, value) or None """
+    m = CONFIG_LINE.match(line)
+    if m:
+        return m.group(1), m.group(2).strip()
+    return None
+
+
+class ListingParser(object):
+    """
+    Picks the SA/DTH out of the /ide/apps or /ide/devices page, which link
+    to their editor like <a href="<prefix><id>" ...>namespace : name</a>.
+    The page can be fed in pieces as it arrives. The pattern has no
+    ambiguous repeats, so it can't backtrack across the page and the time
+    taken is linear in its size. Attributes may come in any order.
+    """
+    # Spelling out both cases is a lot faster than re.IGNORECASE
+    ENTRY = '<[aA]\\s[^>]*?\\b[hH][rR][eE][fF]\\s*=\\s*"%s([^"]+)"[^>]*>([^<]*(?:<(?!/[aA]\\s*>)[^<]*)*)</[aA]\\s*>'
+    TAG = re.compile('<[^>]*>')
+    patterns = {}
+
+    def __init__(self, prefix):
+        if prefix not in ListingParser.patterns:
+            ListingParser.patterns[prefix] = re.compile(ListingParser.ENTRY % re.escape(prefix))
+        self.pattern = ListingParser.patterns[prefix]
+        self.buffer = ""
+        self.result = {}
+
+    def feed(self, data):
+        """ Parses the next piece of the page, keeping a possibly incomplete entry for later """
+        self.buffer += data
+        pos = 0
+        for m in self.pattern.finditer(self.buffer):
+            self.addEntry(m.group(1), m.group(2))
+            pos = m.end()
+        last = max(self.buffer.rfind("<a", pos), self.buffer.rfind("<A", pos))
+        if last == -1:
+            # Only the end might be the start of an entry
+            last = max(pos, len(self.buffer) - 1)
+        self.buffer = self.buffer[last:]
+
+    def addEntry(self, uuid, text):
+        if "<" in text:
+            text = ListingParser.TAG.sub("", text)
+        if ":" not in text:
+            return
+        namespace, name = text.split(":", 1)
+        self.result[uuid] = {'id' : uuid, 'namespace' : namespace.strip(), 'name' : name.strip()}
+
+    def close(self):
+        """ Returns a hashmap with the ID of the app as key and the name and namespace """
+        self.buffer = ""
+        return self.result
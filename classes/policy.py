@@ -0,0 +1,74 @@
+import time
+import random
+import threading
+
+class TokenBucket(object):
+    """ Allows rate requests per second on average, with bursts of up to burst requests """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self.tokens = self.burst
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """ Waits until a request may be sent """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class RequestPolicy(object):
+    """
+    Decides how fast and how many requests STServer may send at a time and
+    which failures are worth another try. Retries back off exponentially,
+    with jitter so parallel jobs don't all come back at the same moment.
+    Only requests which can safely be repeated are retried.
+    """
+    # Server is overloaded or throttling us, try again later
+    RETRY_STATUS = [429, 500, 502, 503, 504]
+
+    def __init__(self, retries=3, backoff=0.5, maxdelay=30.0, rate=0, concurrency=0):
+        self.retries = retries
+        self.backoff = backoff
+        self.maxdelay = maxdelay
+        self.bucket = None
+        if rate > 0:
+            self.bucket = TokenBucket(rate)
+        self.slots = None
+        if concurrency > 0:
+            self.slots = threading.BoundedSemaphore(concurrency)
+
+    def acquire(self):
+        """ Waits until a request may be sent, must be followed by release() """
+        if self.slots:
+            self.slots.acquire()
+        if self.bucket:
+            self.bucket.take()
+
+    def release(self):
+        if self.slots:
+            self.slots.release()
+
+    def shouldRetry(self, attempt, idempotent, status=None):
+        """ Returns True if a request which failed (with status, or None if it never got a response) is retried """
+        if not idempotent or attempt >= self.retries:
+            return False
+        return status is None or status in RequestPolicy.RETRY_STATUS
+
+    def getDelay(self, attempt, retryafter=None):
+        """ Returns how long to wait before retry number attempt (starting at 0) """
+        delay = min(self.maxdelay, self.backoff * (2 ** attempt))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if retryafter is not None:
+            try:
+                delay = max(delay, min(self.maxdelay, float(retryafter)))
+            except ValueError:
+                pass
+        return delay
@@ -0,0 +1,27 @@
+from classes.diskcache import getCacheFile, loadJson, saveJson
+
+class SessionStore(object):
+    """
+    Remembers the cookies of a logged in session on disk (readable only by
+    the user), so the next invocation can skip logging in again.
+    """
+    def __init__(self, server, username, path=None):
+        self.filename = getCacheFile("session", server, username, path)
+
+    def load(self, session):
+        """ Adds the saved cookies to session, returns True if there were any """
+        cookies = loadJson(self.filename)
+        if not cookies:
+            return False
+        for c in cookies:
+            session.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"], secure=c["secure"], expires=c["expires"])
+        return True
+
+    def save(self, session):
+        cookies = []
+        for c in session.cookies:
+            cookies.append({"name" : c.name, "value" : c.value, "domain" : c.domain, "path" : c.path, "secure" : c.secure, "expires" : c.expires})
+        saveJson(self.filename, cookies)
+
+    def clear(self):
+        saveJson(self.filename, [])
@@ -2,7 +2,20 @@ import sys
 import os
 import requests
 import json
-import re
+import time
+import hashlib
+import tempfile
+import threading
+
+from classes.parallel import runParallel, transferSummary
+from classes.trace import RequestTrace
+from classes.policy import RequestPolicy
+from classes import parsing
+from classes.parsing import ListingParser
+
+# Needed to give downloaded files the permissions open() would have given them
+UMASK = os.umask(0)
+os.umask(UMASK)
 
 class STServer:
     TYPE_SA = 1
@@ -17,6 +30,12 @@ class STServer:
         'VIEW'      : 'views'
     }
 
+    # Default number of pooled connections, same as requests uses
+    POOL_SIZE = 10
+
+    # How much of a download is kept in memory at any time
+    CHUNK_SIZE = 64 * 1024
+
     URL_PATH = {}
     URL_PATH['login'] = '/j_spring_security_check'
     URL_PATH['smartapps'] = '/ide/apps'
@@ -41,82 +60,225 @@ class STServer:
     URL_PATH['devicetype-update'] = '/ide/device/compile'
     URL_PATH['devicetype-publish'] = '/ide/device/publishAjax'
 
+    # Requests which can safely be sent again should the first try fail
+    IDEMPOTENT = [
+        'login',
+        'smartapps', 'smartapp-resources', 'smartapp-download', 'smartapp-editor', 'smartapp-update', 'smartapp-publish',
+        'devicetypes', 'devicetype-resources', 'devicetype-download', 'devicetype-editor', 'devicetype-update', 'devicetype-publish'
+    ]
+
     def __init__(self, username, password, baseUrl):
         self.URL_BASE = baseUrl
         self.USERNAME = username
         self.PASSWORD = password
         self.session = requests.Session()
+        self.poolsize = STServer.POOL_SIZE
+        self.sessionstore = None
+        self.loginlock = threading.Lock()
+        self.logins = 0
+        self.trace = RequestTrace()
+        self.policy = RequestPolicy()
+        self.ids = {}
+        self.idslock = threading.Lock()
+
+    def setConcurrency(self, jobs):
+        """ Makes sure the connection pool is big enough for jobs threads sharing the session """
+        if jobs <= self.poolsize:
+            return
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=jobs)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.poolsize = jobs
 
     def resolve(self, type=None):
         if type is None:
             return self.URL_BASE
-        return "%s/%s" % (self.URL_BASE, self.URL_PATH[type])
+        return self.URL_BASE + self.URL_PATH[type]
+
+    def setPolicy(self, policy):
+        """ Changes the retry, rate limit and concurrency rules (see RequestPolicy) """
+        self.policy = policy
+
+    def setSessionStore(self, store):
+        """ Makes the server remember its login session in store (see SessionStore) """
+        self.sessionstore = store
+
+    def resume(self):
+        """
+        Picks up the session saved by a previous login, if any. This does not
+        talk to the server, an expired session is detected (and replaced by a
+        new login) on the first request.
+        """
+        if self.sessionstore is None:
+            return False
+        return self.sessionstore.load(self.session)
+
+    def isLoginRequired(self, r):
+        """ Returns True if the server sent us to the login page instead of answering """
+        if r.status_code == 401:
+            return True
+        if r.status_code in [301, 302, 303] and "/login" in r.headers.get("Location", ""):
+            return True
+        if r.history and "/login" in r.url:
+            return True
+        return False
+
+    def request(self, method, path, suffix="", consume=None, **kwargs):
+        """
+        Sends a request to the URL_PATH entry path (plus suffix). Should the
+        session have expired, it logs in again and repeats the request.
+
+        If consume is given, the body is streamed and consume(r) reads it as
+        part of the request (see attempt), what it returns is kept in
+        r.consumed. It's None unless the request succeeded.
+        """
+        url = self.resolve(path) + suffix
+        logins = self.logins
+        if consume is not None:
+            kwargs["consume"] = consume
+            kwargs["stream"] = True
+        r = self.send(method, path, url, **kwargs)
+        if path != "login" and self.isLoginRequired(r):
+            with self.loginlock:
+                # Another thread might have logged in already
+                if logins == self.logins and not self.login():
+                    print("ERROR: Session expired and unable to login again")
+                    return r
+            r = self.send(method, path, url, **kwargs)
+        return r
+
+    def send(self, method, path, url, **kwargs):
+        """
+        Sends a request as the policy allows, repeating it if it failed in a
+        way worth another try (see RequestPolicy)
+        """
+        idempotent = path in STServer.IDEMPOTENT
+        attempt = 0
+        while True:
+            try:
+                r = self.attempt(method, path, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError):
+                if not self.policy.shouldRetry(attempt, idempotent):
+                    raise
+                delay = self.policy.getDelay(attempt)
+            else:
+                if not self.policy.shouldRetry(attempt, idempotent, r.status_code):
+                    return r
+                delay = self.policy.getDelay(attempt, r.headers.get("Retry-After"))
+                r.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def attempt(self, method, path, url, consume=None, **kwargs):
+        """
+        Performs a single HTTP request and records it in the trace. The body
+        of a successful request is handed to consume, if given, before its
+        place in the policy is given up, so it's limited like any other
+        request. Should reading it fail, the request is tried again by send.
+        A streamed body may not have been read at all, so its size is taken
+        from the headers.
+        """
+        self.policy.acquire()
+        when = time.time()
+        r = None
+        try:
+            r = self.session.request(method, url, **kwargs)
+            if consume is not None:
+                r.consumed = None
+                if r.status_code == 200 and not self.isLoginRequired(r):
+                    try:
+                        r.consumed = consume(r)
+                    finally:
+                        r.close()
+        finally:
+            self.policy.release()
+            status = None
+            size = 0
+            if r is not None:
+                status = r.status_code
+                if kwargs.get("stream"):
+                    size = int(r.headers.get("Content-Length") or 0)
+                else:
+                    size = len(r.content)
+            self.trace.record(path, method, status, size, time.time() - when, when)
+        return r
 
     def login(self):
         post = {"j_username" : self.USERNAME, "j_password" : self.PASSWORD}
-        r = self.session.post(self.resolve("login"), data=post, cookies={}, allow_redirects=False)
+        self.session.cookies.clear()
+        r = self.request("post", "login", data=post, allow_redirects=False)
         if r.status_code == 302 and "authfail" not in r.headers["Location"]:
+            self.logins += 1
+            if self.sessionstore:
+                self.sessionstore.save(self.session)
             return True
+        if self.sessionstore:
+            self.sessionstore.clear()
         return False
 
+    def loadListing(self, path, prefix):
+        """ Streams a page listing SA/DTH through a ListingParser, returns what it found or None """
+        def parse(r):
+            if r.encoding is None:
+                r.encoding = "utf-8"
+            parser = ListingParser(prefix)
+            for chunk in r.iter_content(STServer.CHUNK_SIZE, decode_unicode=True):
+                parser.feed(chunk)
+            return parser.close()
+
+        r = self.request("post", path, consume=parse)
+        r.close()
+        return r.consumed
+
     def listSmartApps(self):
         """
         " Returns a hashmap with the ID of the app as key and the name and namespace
         """
-        r = self.session.post(self.resolve("smartapps"))
-        if r.status_code != 200:
+        result = self.loadListing("smartapps", "/ide/app/editor/")
+        if result is None:
             print("ERROR: Failed to get smartapps list")
-            return None
-
-        apps = re.compile('\<a href="/ide/app/editor/([^"]+)".*?\>\<img .+?\>\s*(.+?)\s*:\s*(.+?)\</a\>', re.MULTILINE|re.IGNORECASE|re.DOTALL)
-        lst = apps.findall(r.text)
-
-        result = {}
-        if lst is not None:
-            for i in lst:
-                result[i[0]] = {'id' : i[0], 'namespace' : i[1], 'name' : i[2]}
         return result
 
     def listDeviceTypes(self):
         """
         " Returns a hashmap with the ID of the app as key and the name and namespace
         """
-        r = self.session.post(self.resolve("devicetypes"))
-        if r.status_code != 200:
-            print("ERROR: Failed to get smartapps list")
-            return None
-
-        apps = re.compile('\<a href="/ide/device/editor/([^"]+)".*?\>\s*(.+?)\s*:\s*(.+?)\</a\>', re.MULTILINE|re.IGNORECASE|re.DOTALL)
-        lst = apps.findall(r.text)
-
-        result = {}
-        if lst is not None:
-            for i in lst:
-                result[i[0]] = {'id' : i[0], 'namespace' : i[1], 'name' : i[2]}
+        result = self.loadListing("devicetypes", "/ide/device/editor/")
+        if result is None:
+            print("ERROR: Failed to get devicetypes list")
         return result
 
-    def __lister__(self, details, path, lst):
+    def __indexer__(self, details, path, index):
+        """ Maps the id of every item in the tree to its filename, path and type """
         for d in details:
-            if "id" in d.keys():
-                lst[d["id"]] = path + "/" + d["text"]
-            elif "children" in d.keys():
-                lst = self.__lister__(d["children"], path + "/" + d["text"], lst)
-        return lst
+            if "id" in d:
+                attr = d.get("li_attr", {})
+                index[d["id"]] = {"filename" : d["text"], "type" : attr.get("resource-type"), "content" : attr.get("resource-content-type"), "path" : path}
+            elif "children" in d:
+                self.__indexer__(d["children"], path + "/" + d["text"], index)
+        return index
 
     def getFileDetails(self, path, uuid):
-        """ Returns a list of files contained in this smartapp """
-        r = self.session.post(self.resolve(path), params={"id" : uuid})
+        """
+        Returns the files contained in this smartapp. The result holds the raw
+        tree ("details"), id -> path ("flat") and id -> item details ("index")
+        """
+        r = self.request("post", path, params={"id" : uuid})
         if r.status_code != 200:
             return None
         try:
-            lst = self.__lister__(r.json(), "", {})
+            details = r.json()
+            index = self.__indexer__(details, "", {})
         except:
             print "FAILURE!"
             print repr(r)
-            print repr(t.text)
+            print repr(r.text)
             sys.exit(255)
 
-        return {"details" : r.json(), "flat" : lst }
+        lst = {}
+        for k,v in index.iteritems():
+            lst[k] = v["path"] + "/" + v["filename"]
+        return {"details" : details, "flat" : lst, "index" : index}
 
     def getSmartAppDetails(self, smartapp):
         """ Returns a list of files contained in this smartapp """
@@ -140,9 +302,16 @@ class STServer:
         return result
 
     def getDetail(self, details, uuid):
-        """ Builds a path and extracts the necessary parts to successfully download an item """
-        info = self.__digger__(details, uuid, "")
-        return info
+        """
+        Builds a path and extracts the necessary parts to successfully download an item.
+        details is either what getFileDetails returned or the raw tree
+        """
+        if isinstance(details, dict):
+            info = details["index"].get(uuid)
+            if info is None:
+                return None
+            return dict(info)
+        return self.__digger__(details, uuid, "")
 
     def downloadItem(self, path, owner, details, uuid):
         """ Downloads the selected item and returns it """
@@ -151,7 +320,7 @@ class STServer:
             print("ERROR: Unable to get details of item " + uuid)
             return None
 
-        r = self.session.post(self.resolve(path), params={"id" : owner, "resourceId" : uuid, "resourceType" : details["type"]})
+        r = self.request("post", path, params={"id" : owner, "resourceId" : uuid, "resourceType" : details["type"]})
         if r.status_code != 200:
             print("ERROR: Unable to download item")
             return None
@@ -159,35 +328,82 @@ class STServer:
         details["data"] = r.content
         return details
 
-    def extractErrorMessage(self, content):
-        p = re.compile('\<div class=\"alert alert\-danger alert\-dismissible flash\"\>(.+?)\<\/div\>', re.MULTILINE|re.IGNORECASE|re.DOTALL)
-        m = p.search(content)
-        if m:
-            # Remove any tags
-            p = re.compile('<[^>]+?>.*?</[^>]+?>')
-            res = p.sub("", m.group(1)).strip()
-            return res
-        return None
+    def saveStream(self, r, dstfile, skiphash=None):
+        """
+        Writes the body of a streamed response to a temporary file which then
+        atomically replaces dstfile. If the content hashes to skiphash and
+        dstfile exists, it's left alone. Returns (bytes, sha1, changed).
+        """
+        directory = os.path.dirname(dstfile) or "."
+        fd, tmp = tempfile.mkstemp(prefix=".stshell-", dir=directory)
+        size = 0
+        digest = hashlib.sha1()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in r.iter_content(STServer.CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            # Not every version of requests notices a body cut short
+            expected = r.headers.get("Content-Length")
+            if expected and not r.headers.get("Content-Encoding") and size != int(expected):
+                raise requests.exceptions.ChunkedEncodingError("Connection broken after %d of %s bytes" % (size, expected))
+            digest = digest.hexdigest()
+            if digest == skiphash and os.path.exists(dstfile):
+                os.remove(tmp)
+                return size, digest, False
+            os.chmod(tmp, 0666 & ~UMASK)
+            if os.name == "nt" and os.path.exists(dstfile):
+                os.remove(dstfile)
+            os.rename(tmp, dstfile)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return size, digest, True
+
+    def downloadItemToFile(self, path, owner, details, uuid, dstfile, skiphash=None):
+        """
+        Downloads the selected item straight into dstfile, without holding it
+        in memory. Returns the details of the item with "size", "hash" and
+        "changed" (see saveStream) added, or None.
+        """
+        details = self.getDetail(details, uuid)
+        if details is None:
+            print("ERROR: Unable to get details of item " + uuid)
+            return None
+
+        params = {"id" : owner, "resourceId" : uuid, "resourceType" : details["type"]}
+        r = self.request("post", path, params=params, consume=lambda r: self.saveStream(r, dstfile, skiphash))
+        r.close()
+        if r.consumed is None:
+            print("ERROR: Unable to download item")
+            return None
+
+        details["size"], details["hash"], details["changed"] = r.consumed
+        return details
 
     def createSmartApp(self, content):
         payload = {"fromCodeType" : "code", "create" : "Create", "content" : content}
-        r = self.session.post(self.resolve("smartapp-create"), data=payload, allow_redirects=False)
+        r = self.request("post", "smartapp-create", data=payload, allow_redirects=False)
         if r.status_code != 302:
-            res = self.extractErrorMessage(r.text)
+            res = parsing.extractErrorMessage(r.text)
             if not res:
                 res = "Unable to create smartapp (unknown reason)"
             print("ERROR: %s" % res)
             return None
 
-        p = re.compile('.*/ide/app/editor/([a-f0-9\-]+)', re.MULTILINE|re.IGNORECASE|re.DOTALL)
-        m = p.match(r.headers["Location"])
-
-        return m.group(1)
+        return parsing.parseEditorLocation("app", r.headers["Location"])
 
     def updateSmartAppItem(self, details, smartapp, uuid, content):
         details = self.getDetail(details, uuid)
+        if details is None:
+            print("ERROR: Unable to get details of item " + uuid)
+            return None
         payload = {"code" : content, "location" : "", "id" : smartapp, "resource" : uuid, "resourceType" : details["type"]}
-        r = self.session.post(self.resolve("smartapp-update"), data=payload)
+        r = self.request("post", "smartapp-update", data=payload)
         if r.status_code != 200:
             print("ERROR: Unable to update item")
             return None
@@ -196,8 +412,11 @@ class STServer:
 
     def updateDeviceTypeItem(self, details, device, uuid, content):
         details = self.getDetail(details, uuid)
+        if details is None:
+            print("ERROR: Unable to get details of item " + uuid)
+            return None
         payload = {"code" : content, "location" : "", "id" : device, "resource" : uuid, "resourceType" : details["type"]}
-        r = self.session.post(self.resolve("devicetype-update"), data=payload)
+        r = self.request("post", "devicetype-update", data=payload)
         if r.status_code != 200:
             print("ERROR: Unable to update item")
             return None
@@ -205,42 +424,66 @@ class STServer:
         return r.json()
 
     def deleteSmartApp(self, uuid):
-        r = self.session.get(self.resolve("smartapp-destroy") + uuid, allow_redirects=False)
+        self.forgetIds(uuid)
+        r = self.request("get", "smartapp-destroy", uuid, allow_redirects=False)
         if r.status_code == 302:
             return True
         elif r.status_code == 200:
-            err = self.extractErrorMessage(r.text)
+            err = parsing.extractErrorMessage(r.text)
             if err is None:
                 err = "Sorry, unknown error, please check from WebIDE"
             print("ERROR: %s" % err)
         return False
 
-    def getSmartAppIds(self, uuid):
-        r = self.session.get(self.resolve("smartapp-editor") + uuid)
+    def forgetIds(self, uuid):
+        """ Drops the cached ids of a SA/DTH, needed once it's published or deleted """
+        with self.idslock:
+            self.ids.pop(uuid, None)
+
+    def getCachedIds(self, uuid, path, parser):
+        """ Returns the ids of a SA/DTH, only loading its editor page if they're not known yet """
+        with self.idslock:
+            if uuid in self.ids:
+                return self.ids[uuid]
+        block = self.loadEditorBlock(path, uuid)
+        if block is None:
+            return None
+        ids = parser(block)
+        if ids is not None:
+            with self.idslock:
+                self.ids[uuid] = ids
+        return ids
+
+    def loadEditorBlock(self, path, uuid):
         """
-        ST.AppIDE.init({
-                            url: '/ide/app/',
-                            websocket: 'wss://ic.connect.smartthings.com:8443/',
-                            client: '1af9e4e7-9a2d-47a4-9edf-c9f326642489',
-                            id: '19d2016d-2337-46bc-ae0e-143e033d4a63',
-                            versionId: '5d01fb38-cd7f-48b3-be2f-2509efb09020',
-                            state: 'NOT_APPROVED'
-                        });
+        Loads the editor page of a SA/DTH just far enough to get the
+        ST.*IDE.init({...}) block holding its ids, instead of fetching and
+        searching the entire page
         """
+        def search(r):
+            text = ""
+            for chunk in r.iter_content(STServer.CHUNK_SIZE, decode_unicode=True):
+                text += chunk
+                m = parsing.IDE_INIT.search(text)
+                if m is None:
+                    # Keep enough to find the marker should it be split
+                    text = text[-32:]
+                    continue
+                end = text.find("})", m.start())
+                if end != -1:
+                    return text[m.start():end + 2]
+                text = text[m.start():]
+            return None
 
-        p = re.compile('ST\.AppIDE\.init\(\{.+?url: \'([^\']+)\',.+?websocket: \'([^\']+)\',.+?client: \'([^\']+)\',.+?id: \'([^\']+)\',.+?versionId: \'([^\']+)\',.+?state: \'([^\']+)\'', re.MULTILINE|re.IGNORECASE|re.DOTALL)
-        m = p.search(r.text)
+        r = self.request("get", path, uuid, consume=search)
+        r.close()
+        if r.status_code != 200:
+            print("ERROR: Unable to load editor page")
+            return None
+        return r.consumed
 
-        if m:
-            return {
-                "url" : m.group(1),
-                "websocket" : m.group(2),
-                "client" : m.group(3),
-                "id" : m.group(4),
-                "versionid" : m.group(5),
-                "state" : m.group(6)
-            }
-        return None
+    def getSmartAppIds(self, uuid):
+        return self.getCachedIds(uuid, "smartapp-editor", parsing.parseSmartAppIds)
 
     """ Uploads content to server, needs special uuid which is not same as app uuid """
     def uploadSmartAppItem(self, uuid, content, filename, path, kind):
@@ -252,32 +495,19 @@ class STServer:
             "uploadResource" : "Upload"
         }
 
-        r = self.session.post(self.resolve("smartapp-upload"), data=data, files=files)
+        r = self.request("post", "smartapp-upload", data=data, files=files)
         if r.status_code == 200:
             return True
         return False
 
     def deleteSmartAppItem(self, uuid, item):
-        r = self.session.post(self.resolve('smartapp-delete'), data={"id" : uuid, "resourceId" : item})
+        r = self.request("post", 'smartapp-delete', data={"id" : uuid, "resourceId" : item})
         if r.status_code == 200:
             return True
         return False
 
     def getDeviceTypeIds(self, uuid):
-        r = self.session.get(self.resolve("devicetype-editor") + uuid)
-        p = re.compile('ST\.DeviceIDE\.init\(\{.+?url: \'([^\']+)\',.+?websocket: \'([^\']+)\',.+?client: \'([^\']+)\',.+?id: \'([^\']+)\'', re.MULTILINE|re.IGNORECASE|re.DOTALL)
-        m = p.search(r.text)
-
-        if m:
-            return {
-                "url" : m.group(1),
-                "websocket" : m.group(2),
-                "client" : m.group(3),
-                "id" : m.group(4),
-                "versionid" : m.group(4), # Same as Id for some reason
-                "state" : None
-            }
-        return None
+        return self.getCachedIds(uuid, "devicetype-editor", parsing.parseDeviceTypeIds)
 
     def uploadDeviceTypeItem(self, uuid, content, filename, path, kind):
         files = {"fileData" : (filename, content)}
@@ -288,39 +518,37 @@ class STServer:
             "uploadResource" : "Upload"
         }
 
-        r = self.session.post(self.resolve("devicetype-upload"), data=data, files=files)
+        r = self.request("post", "devicetype-upload", data=data, files=files)
         if r.status_code == 200:
             return True
         return False
 
     def deleteDeviceTypeItem(self, uuid, item):
-        r = self.session.post(self.resolve('devicetype-delete'), data={"id" : uuid, "resourceId" : item})
+        r = self.request("post", 'devicetype-delete', data={"id" : uuid, "resourceId" : item})
         if r.status_code == 200:
             return True
         return False
 
     def createDeviceType(self, content):
         payload = {"fromCodeType" : "code", "create" : "Create", "content" : content}
-        r = self.session.post(self.resolve("devicetype-create"), data=payload, allow_redirects=False)
+        r = self.request("post", "devicetype-create", data=payload, allow_redirects=False)
         if r.status_code != 302:
-            res = self.extractErrorMessage(r.text)
+            res = parsing.extractErrorMessage(r.text)
             if not res:
                 res = "Unable to create devicetype (unknown reason)"
             print("ERROR: %s" % res)
             return None
 
-        p = re.compile('.*/ide/device/editor/([a-f0-9\-]+)', re.MULTILINE|re.IGNORECASE|re.DOTALL)
-        m = p.match(r.headers["Location"])
-
-        return m.group(1)
+        return parsing.parseEditorLocation("device", r.headers["Location"])
 
     def deleteDeviceType(self, uuid):
+        self.forgetIds(uuid)
         payload = {"id" : uuid, "_action_delete" : "Delete"}
-        r = self.session.post(self.resolve('devicetype-destroy'), data=payload, allow_redirects=False)
+        r = self.request("post", 'devicetype-destroy', data=payload, allow_redirects=False)
         if r.status_code == 302:
             return True
         elif r.status_code == 200:
-            err = self.extractErrorMessage(r.text)
+            err = parsing.extractErrorMessage(r.text)
             if err is None:
                 err = "Sorry, unknown error, please check from WebIDE"
             print("ERROR: %s" % err)
@@ -332,8 +560,14 @@ class STServer:
     def downloadDeviceTypeItem(self, devicetype, details, uuid):
         return self.downloadItem("devicetype-download", devicetype, details, uuid)
 
+    def downloadSmartAppItemToFile(self, smartapp, details, uuid, dstfile, skiphash=None):
+        return self.downloadItemToFile("smartapp-download", smartapp, details, uuid, dstfile, skiphash)
+
+    def downloadDeviceTypeItemToFile(self, devicetype, details, uuid, dstfile, skiphash=None):
+        return self.downloadItemToFile("devicetype-download", devicetype, details, uuid, dstfile, skiphash)
+
     # Convenience, downloads an entire smartapp
-    def downloadBundle(self, kind, uuid, dest):
+    def downloadBundle(self, kind, uuid, dest, jobs=1):
         print("Downloading bundle...")
         if kind == STServer.TYPE_SA:
             data = self.getSmartAppDetails(uuid)
@@ -347,41 +581,53 @@ class STServer:
             os.makedirs(dest)
         except:
             pass
-        for i in data["flat"]:
-            sys.stdout.write("  Downloading " + i + ": ")
+
+        def fetch(i):
+            info = self.getDetail(data, i)
+            try:
+                os.makedirs(dest + info["path"])
+            except:
+                pass
+            filename = dest + info["path"] + "/" + info["filename"]
             if kind == STServer.TYPE_SA:
-                content = self.downloadSmartAppItem(uuid, data["details"], i)
+                return self.downloadSmartAppItemToFile(uuid, data, i, filename)
             elif kind == STServer.TYPE_DTH:
-                content = self.downloadDeviceTypeItem(uuid, data["details"], i)
+                return self.downloadDeviceTypeItemToFile(uuid, data, i, filename)
+
+        self.setConcurrency(jobs)
+        start = time.time()
+        failed = 0
+        size = 0
+        for i, content in runParallel(fetch, data["flat"], jobs):
             if content is None:
-                print("Failed")
+                print("  Downloading %s: Failed" % i)
+                failed += 1
             else:
-                filename = dest + content["path"] + "/" + content["filename"]
-                print("OK (%s)" % content["filename"])
-                try:
-                    os.makedirs(dest + content["path"])
-                except:
-                    pass
-                with open(filename, "wb") as f:
-                    f.write(content["data"])
-        return True
-
-    def downloadSmartApp(self, uuid, dest):
-        return self.downloadBundle(self.TYPE_SA, uuid, dest)
-
-    def downloadDeviceType(self, uuid, dest):
-        return self.downloadBundle(self.TYPE_DTH, uuid, dest)
+                print("  Downloading %s: OK (%s, %d bytes)" % (i, content["filename"], content["size"]))
+                size += content["size"]
+        print("Downloaded " + transferSummary(len(data["flat"]), failed, size, time.time() - start))
+        return failed == 0
+
+    def downloadSmartApp(self, uuid, dest, jobs=1):
+        return self.downloadBundle(self.TYPE_SA, uuid, dest, jobs)
+
+    def downloadDeviceType(self, uuid, dest, jobs=1):
+        return self.downloadBundle(self.TYPE_DTH, uuid, dest, jobs)
 
     def publishDeviceType(self, uuid):
         payload = {"id" : uuid, "scope" : "me"}
-        r = self.session.post(self.resolve('devicetype-publish'), data=payload, allow_redirects=False)
+        # Publishing creates a new version
+        self.forgetIds(uuid)
+        r = self.request("post", 'devicetype-publish', data=payload, allow_redirects=False)
         if r.status_code == 200:
             return True
         return False
 
     def publishSmartApp(self, uuid):
         payload = {"id" : uuid, "scope" : "me"}
-        r = self.session.post(self.resolve('smartapp-publish'), data=payload, allow_redirects=False)
+        # Publishing creates a new version
+        self.forgetIds(uuid)
+        r = self.request("post", 'smartapp-publish', data=payload, allow_redirects=False)
         if r.status_code == 200:
             return True
         return False
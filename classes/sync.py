@@ -0,0 +1,250 @@
+import os
+import sys
+import hashlib
+
+from classes.diskcache import loadJson, saveJson
+
+def isIgnored(name):
+    """ Hidden files (like the manifest) and backups are never pushed """
+    return name.startswith(".") or name.endswith("~")
+
+def listLocal(directory):
+    """ Returns all files below directory as paths relative to it, like "/images/icon.png" """
+    result = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not isIgnored(d)]
+        for f in files:
+            if isIgnored(f):
+                continue
+            path = os.path.relpath(os.path.join(root, f), directory)
+            result.append("/" + path.replace(os.sep, "/"))
+    return result
+
+class BundleSync(object):
+    """
+    Pushes a local directory laid out like the SmartApp/DeviceType (the way
+    get and download store it) to the server. Only new or changed files are
+    sent. The hashes of what was pushed are kept in a manifest file inside
+    the directory.
+    """
+    MANIFEST = ".stshell-manifest"
+
+    def __init__(self, conn, kind, uuid, directory):
+        self.conn = conn
+        self.kind = kind
+        self.uuid = uuid
+        self.directory = directory
+        self.manifestfile = os.path.join(directory, BundleSync.MANIFEST)
+        self.manifest = {}
+        self.details = None
+        data = loadJson(self.manifestfile)
+        if data is not None and data.get("bundle") == uuid:
+            self.manifest = data["files"]
+
+    def getDetails(self):
+        if self.kind == 'sa':
+            return self.conn.getSmartAppDetails(self.uuid)
+        return self.conn.getDeviceTypeDetails(self.uuid)
+
+    def hashData(self, data):
+        return hashlib.sha1(data).hexdigest()
+
+    def getLocalPath(self, path):
+        return os.path.join(self.directory, path[1:])
+
+    def readFile(self, path):
+        with open(self.getLocalPath(path), "rb") as f:
+            return f.read()
+
+    def listLocal(self):
+        """ Returns all local files as paths relative to the bundle, like "/images/icon.png" """
+        return listLocal(self.directory)
+
+    def getUploadType(self, path):
+        """ Returns the UPLOAD_TYPE and subpath a new file has to be uploaded with, or None """
+        parts = path.split("/")[1:]
+        if len(parts) < 2:
+            return None
+        for k,v in self.conn.UPLOAD_TYPE.iteritems():
+            if v == parts[0]:
+                return k, "/".join(parts[1:-1])
+        return None
+
+    def isSame(self, path, itemid, digest, details):
+        """
+        Checks if the remote file is identical to the local one, using the
+        manifest or, if the file is unknown, by comparing with the server
+        """
+        known = self.manifest.get(path)
+        if known is not None:
+            return known["id"] == itemid and known["hash"] == digest
+        if self.kind == 'sa':
+            remote = self.conn.downloadSmartAppItem(self.uuid, details, itemid)
+        else:
+            remote = self.conn.downloadDeviceTypeItem(self.uuid, details, itemid)
+        if remote is None or self.hashData(remote["data"]) != digest:
+            return False
+        self.manifest[path] = {"id" : itemid, "hash" : digest}
+        return True
+
+    def plan(self, details, delete=False, paths=None):
+        """
+        Compares the local files with details (the getFileDetails result of
+        the bundle) and returns a sorted list of (action, path, item) where
+        action is upload, update, delete or skip. If paths is given, only
+        those are looked at instead of all files.
+        """
+        remote = {}
+        for k,v in details["flat"].iteritems():
+            remote[v] = k
+
+        result = []
+        if paths is None:
+            local = self.listLocal()
+        else:
+            local = [p for p in paths if os.path.isfile(self.getLocalPath(p))]
+        for path in local:
+            digest = self.hashData(self.readFile(path))
+            if path in remote:
+                if not self.isSame(path, remote[path], digest, details):
+                    result.append(("update", path, remote[path]))
+            elif self.getUploadType(path) is None:
+                result.append(("skip", path, None))
+            else:
+                result.append(("upload", path, None))
+        if delete:
+            for path in (remote if paths is None else paths):
+                if path in remote and path not in local:
+                    result.append(("delete", path, remote[path]))
+        return sorted(result, key=lambda x: x[1])
+
+    def printPlan(self, plan):
+        if len(plan) == 0:
+            print("Nothing to do, everything is up-to-date")
+        for action, path, item in plan:
+            if action == "skip":
+                print("  skip    %s (not in a folder which allows uploads)" % path)
+            else:
+                print("  %-7s %s" % (action, path))
+
+    def printResult(self, result):
+        if result is None:
+            print("Failed")
+            return False
+        if not result["errors"] and not result["output"]:
+            print("OK")
+            return True
+        print("Failed")
+        if "errors" in result and result["errors"]:
+            print("Errors:")
+            for e in result["errors"]:
+                print("  " + e)
+        if "output" in result and result["output"]:
+            print("Details:")
+            for o in result["output"]:
+                print("  " + o)
+        return False
+
+    def run(self, details, plan):
+        """ Executes the plan, returns True if all went well """
+        success = True
+        ids = None
+        uploaded = False
+        deleted = False
+        for action, path, item in plan:
+            if action == "skip":
+                continue
+            sys.stdout.write('%s "%s" ... ' % (action.capitalize(), path))
+            sys.stdout.flush()
+            if action == "delete":
+                if self.kind == 'sa':
+                    ok = self.conn.deleteSmartAppItem(self.uuid, item)
+                else:
+                    ok = self.conn.deleteDeviceTypeItem(self.uuid, item)
+                print("OK" if ok else "Failed")
+                if ok:
+                    deleted = True
+                    self.manifest.pop(path, None)
+                success = success and ok
+                continue
+
+            data = self.readFile(path)
+            if action == "update":
+                if self.kind == 'sa':
+                    result = self.conn.updateSmartAppItem(details, self.uuid, item, data)
+                else:
+                    result = self.conn.updateDeviceTypeItem(details, self.uuid, item, data)
+                ok = self.printResult(result)
+                if ok:
+                    self.manifest[path] = {"id" : item, "hash" : self.hashData(data)}
+            elif action == "upload":
+                kind, subpath = self.getUploadType(path)
+                filename = path.split("/")[-1]
+                # Known ids go stale once the bundle is published elsewhere,
+                # so a failed upload is tried once more with fresh ones
+                for attempt in range(2):
+                    if ids is None:
+                        if self.kind == 'sa':
+                            ids = self.conn.getSmartAppIds(self.uuid)
+                        else:
+                            ids = self.conn.getDeviceTypeIds(self.uuid)
+                        if ids is None:
+                            print("Failed (unable to get ids of bundle)")
+                            return False
+                    if self.kind == 'sa':
+                        ok = self.conn.uploadSmartAppItem(ids['versionid'], data, filename, subpath, kind)
+                    else:
+                        ok = self.conn.uploadDeviceTypeItem(ids['versionid'], data, filename, subpath, kind)
+                    if ok:
+                        break
+                    self.conn.forgetIds(self.uuid)
+                    ids = None
+                print("OK" if ok else "Failed")
+                if ok:
+                    uploaded = True
+                    self.manifest[path] = {"id" : None, "hash" : self.hashData(data)}
+            success = success and ok
+
+        # New files got new ids, pick those up
+        self.details = details
+        if uploaded or deleted:
+            details = self.getDetails()
+            if details is not None:
+                self.details = details
+                for k,v in details["flat"].iteritems():
+                    if v in self.manifest and self.manifest[v]["id"] is None:
+                        self.manifest[v]["id"] = k
+        self.save()
+        return success
+
+    def publish(self):
+        """ Publishes the bundle, returns True if it worked """
+        sys.stdout.write("Publishing ... ")
+        sys.stdout.flush()
+        if self.kind == 'sa':
+            ok = self.conn.publishSmartApp(self.uuid)
+        else:
+            ok = self.conn.publishDeviceType(self.uuid)
+        print("OK" if ok else "Failed")
+        return ok
+
+    def save(self):
+        files = {}
+        for k,v in self.manifest.iteritems():
+            if v["id"] is not None:
+                files[k] = v
+        saveJson(self.manifestfile, {"bundle" : self.uuid, "files" : files})
+
+    def sync(self, details=None, delete=False, dryrun=False):
+        """ Plans and (unless dryrun) executes a sync, returns True if all went well """
+        if details is None:
+            details = self.getDetails()
+        if details is None:
+            print("ERROR: Unable to get the contents of the bundle")
+            return False
+        plan = self.plan(details, delete)
+        self.printPlan(plan)
+        if dryrun:
+            self.save()
+            return True
+        return self.run(details, plan)
@@ -0,0 +1,83 @@
+import json
+import threading
+import collections
+
+class RequestTrace(object):
+    """
+    Records every request STServer makes: the URL_PATH key it went to,
+    method, status, bytes received and how long it took. Only the last
+    MAX_EVENTS are kept so a long running console or daemon doesn't grow
+    without bounds.
+    """
+    MAX_EVENTS = 100000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = collections.deque(maxlen=RequestTrace.MAX_EVENTS)
+        self.count = 0
+
+    def record(self, route, method, status, size, elapsed, when):
+        with self.lock:
+            self.events.append({"seq" : self.count, "time" : when, "route" : route, "method" : method.upper(), "status" : status, "bytes" : size, "elapsed" : elapsed})
+            self.count += 1
+
+    def mark(self):
+        """ Returns a marker which makes getEvents/summarize skip what has been recorded so far """
+        with self.lock:
+            return self.count
+
+    def reset(self):
+        with self.lock:
+            self.events.clear()
+
+    def getEvents(self, since=0):
+        with self.lock:
+            return [e for e in self.events if e["seq"] >= since]
+
+    def percentile(self, values, pct):
+        """ Nearest rank percentile of the sorted list values """
+        if not values:
+            return 0.0
+        rank = int(round(pct / 100.0 * len(values) + 0.5)) - 1
+        return values[max(0, min(rank, len(values) - 1))]
+
+    def summarize(self, since=0):
+        """ Returns {route : {count, errors, p50, p95, total, bytes}}, times in seconds """
+        routes = {}
+        for e in self.getEvents(since):
+            routes.setdefault(e["route"], []).append(e)
+        result = {}
+        for route, events in routes.iteritems():
+            times = sorted(e["elapsed"] for e in events)
+            result[route] = {
+                "count" : len(events),
+                "errors" : len([e for e in events if e["status"] is None or e["status"] >= 400]),
+                "p50" : self.percentile(times, 50),
+                "p95" : self.percentile(times, 95),
+                "total" : sum(times),
+                "bytes" : sum(e["bytes"] for e in events)
+            }
+        return result
+
+    def formatSummary(self, since=0):
+        """ Returns the summary as a printable table """
+        summary = self.summarize(since)
+        if not summary:
+            return "No requests made"
+        lines = ["%-24s %6s %6s %9s %9s %10s %12s" % ("Route", "Count", "Errors", "p50 ms", "p95 ms", "Total ms", "Bytes")]
+        for route in sorted(summary, key=lambda x: -summary[x]["total"]):
+            s = summary[route]
+            lines.append("%-24s %6d %6d %9.1f %9.1f %10.1f %12d" % (route, s["count"], s["errors"], s["p50"] * 1000, s["p95"] * 1000, s["total"] * 1000, s["bytes"]))
+        lines.append("%-24s %6d %6d %9s %9s %10.1f %12d" % ("Total",
+            sum(s["count"] for s in summary.values()),
+            sum(s["errors"] for s in summary.values()),
+            "", "",
+            sum(s["total"] for s in summary.values()) * 1000,
+            sum(s["bytes"] for s in summary.values())))
+        return "\n".join(lines)
+
+    def dump(self, filename, since=0):
+        """ Appends the raw events to filename, one JSON object per line """
+        with open(filename, "a") as f:
+            for e in self.getEvents(since):
+                f.write(json.dumps(e) + "\n")
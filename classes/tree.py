@@ -0,0 +1,254 @@
+import sys
+import collections
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+class TreeNode(object):
+    """
+    A file or folder of the console's emulated filesystem. Nodes only know
+    their own name and the folder they're in, the absolute path, the SA/DTH
+    they belong to and its kind are found by following the folders up, so
+    none of them is stored over and over. For the rest of the console, a
+    node still reads like the dict it used to be:
+
+        name   - absolute path
+        dir    - True for folders
+        parent - id of the SA/DTH the node belongs to, None outside of one
+        type   - kind of SA/DTH ('sa' or 'dth')
+        uuid   - id of the file on the server, None for folders
+        stale  - True if the contents of the folder have yet to be loaded
+        cached - True if the contents came from the disk cache
+    """
+    __slots__ = ["segment", "up", "children", "uuid", "module", "kind", "stale", "cached"]
+
+    def __init__(self, segment, up, dir, uuid=None, module=None, kind=None, stale=False):
+        self.segment = segment
+        self.up = up
+        self.children = {} if dir else None
+        self.uuid = uuid
+        self.module = module
+        self.kind = kind
+        self.stale = stale
+        self.cached = None
+
+    def getPath(self):
+        parts = []
+        node = self
+        while node.up is not None:
+            parts.append(node.segment)
+            node = node.up
+        parts.reverse()
+        return "/" + "/".join(parts)
+
+    def getModule(self):
+        """ Returns the id of the SA/DTH this node is part of """
+        node = self
+        while node is not None:
+            if node.module is not None:
+                return node.module
+            node = node.up
+        return None
+
+    def getKind(self):
+        node = self
+        while node is not None:
+            if node.kind is not None:
+                return node.kind
+            node = node.up
+        return None
+
+    def __getitem__(self, key):
+        if key == "name":
+            return self.getPath()
+        elif key == "dir":
+            return self.children is not None
+        elif key == "parent":
+            return self.getModule()
+        elif key == "type":
+            return self.getKind()
+        elif key in ["uuid", "stale", "cached"]:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in ["stale", "cached"]:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def asDict(self):
+        result = {}
+        for key in ["name", "dir", "parent", "type", "uuid", "stale", "cached"]:
+            result[key] = self[key]
+        return result
+
+    def __repr__(self):
+        return repr(self.asDict())
+
+class ConsoleTree(object):
+    """
+    Holds the nodes of the console's emulated filesystem, looked up by
+    absolute path. Every folder keeps its children by name, so listings and
+    subtree operations only touch the relevant part of the tree instead of
+    scanning every node in the account. Names are shared between all nodes
+    using them, as many ("images", "css", ...) appear in every SA/DTH.
+    """
+    def __init__(self):
+        self.root = TreeNode("", None, True)
+        self.segments = {}
+        self.count = 0
+
+    def splitName(self, path):
+        """ Returns the parent path and the last part of the path """
+        parent, _, name = path.rpartition("/")
+        return parent, name
+
+    def find(self, path):
+        """ Returns the node at path (the root for ""), or None """
+        node = self.root
+        if path == "":
+            return node
+        for segment in path.split("/")[1:]:
+            if node.children is None:
+                return None
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def add(self, path, dir, uuid=None, module=None, kind=None, stale=False):
+        """
+        Adds a node to the tree, or replaces what's known about an existing
+        one. Missing folders on the way are created.
+        """
+        parent, name = self.splitName(path)
+        up = self.find(parent)
+        if up is None or up.children is None:
+            up = self.add(parent, True)
+        name = self.segments.setdefault(name, name)
+        node = up.children.get(name)
+        if node is None:
+            node = TreeNode(name, up, dir, uuid, module, kind, stale)
+            up.children[name] = node
+            self.count += 1
+        else:
+            if dir and node.children is None:
+                node.children = {}
+            elif not dir and node.children is not None:
+                self.count -= self.countNodes(node) - 1
+                node.children = None
+            node.uuid = uuid
+            node.module = module
+            node.kind = kind
+            node.stale = stale
+            node.cached = None
+        return node
+
+    def countNodes(self, node):
+        """ Returns the number of nodes in the subtree of node, itself included """
+        count = 1
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            if current.children:
+                count += len(current.children)
+                pending.extend(current.children.values())
+        return count
+
+    def __contains__(self, path):
+        return path != "" and self.find(path) is not None
+
+    def __getitem__(self, path):
+        node = None
+        if path != "":
+            node = self.find(path)
+        if node is None:
+            raise KeyError(path)
+        return node
+
+    def __iter__(self):
+        return self.walk("")
+
+    def __len__(self):
+        return self.count
+
+    def get(self, path, default=None):
+        if path in self:
+            return self[path]
+        return default
+
+    def values(self):
+        return [self[p] for p in self]
+
+    def pop(self, path, default=None):
+        """ Removes a node, along with everything below it, from the tree """
+        if path not in self:
+            return default
+        node = self[path]
+        del node.up.children[node.segment]
+        self.count -= self.countNodes(node)
+        return node
+
+    def listDir(self, path):
+        """ Returns the names of the direct children of path """
+        node = self.find(path)
+        if node is None or node.children is None:
+            return []
+        return list(node.children)
+
+    def walk(self, path):
+        """ Yields path and every path below it, breadth first """
+        node = self.find(path)
+        if node is None:
+            return
+        queue = collections.deque([(path, node)])
+        while queue:
+            current, node = queue.popleft()
+            if node.up is not None:
+                yield current
+            if node.children:
+                for name, child in node.children.items():
+                    queue.append((current + "/" + name, child))
+
+    def removeTree(self, path):
+        """ Removes path and everything below it """
+        lst = list(self.walk(path))
+        self.pop(path)
+        return lst
+
+    def getMemoryUsage(self):
+        """ Returns the approximate number of bytes taken by the nodes, their folders and names """
+        size = sys.getsizeof(self.segments)
+        for segment in self.segments:
+            size += sys.getsizeof(segment)
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            size += sys.getsizeof(node)
+            if node.children is not None:
+                size += sys.getsizeof(node.children)
+                pending.extend(node.children.values())
+        return size
+
+def getRss():
+    """ Returns the memory currently used by this process in bytes (or the peak), None if unknown """
+    if resource is None:
+        return None
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, ValueError, IndexError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
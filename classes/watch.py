@@ -0,0 +1,224 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from classes.sync import isIgnored, listLocal
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+def loadInotify():
+    """ Returns the C library if it offers inotify (ie, on Linux), otherwise None """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class InotifyWatcher(object):
+    """
+    Reports the files changed below a directory, as the kernel tells us
+    about them. Every folder needs a watch of its own, new ones are added
+    as they appear.
+    """
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, directory, libc):
+        self.directory = directory
+        self.libc = libc
+        self.fd = libc.inotify_init1(0)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "Unable to use inotify")
+        self.dirs = {}
+        self.addTree("")
+
+    def addTree(self, path):
+        """ Watches the folder path (relative, like "/images") and those below it, returns the files found """
+        files = set()
+        for root, dirs, names in os.walk(os.path.join(self.directory, path[1:])):
+            dirs[:] = [d for d in dirs if not isIgnored(d)]
+            rel = os.path.relpath(root, self.directory)
+            rel = "" if rel == "." else "/" + rel.replace(os.sep, "/")
+            wd = self.libc.inotify_add_watch(self.fd, root, InotifyWatcher.MASK)
+            if wd >= 0:
+                self.dirs[wd] = rel
+            for n in names:
+                if not isIgnored(n):
+                    files.add(rel + "/" + n)
+        return files
+
+    def wait(self, timeout=None):
+        """
+        Waits up to timeout seconds for changes. Returns the set of changed
+        (or deleted) files, or None if we lost track and everything has to
+        be looked at.
+        """
+        try:
+            ready = select.select([self.fd], [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return set()
+            raise
+        if not ready:
+            return set()
+
+        data = os.read(self.fd, 65536)
+        changed = set()
+        pos = 0
+        while pos + InotifyWatcher.EVENT.size <= len(data):
+            wd, mask, cookie, length = InotifyWatcher.EVENT.unpack_from(data, pos)
+            pos += InotifyWatcher.EVENT.size
+            name = data[pos:pos + length].rstrip("\0")
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                # Folder is gone
+                self.dirs.pop(wd, None)
+                continue
+            if wd not in self.dirs or not name or isIgnored(name):
+                continue
+            path = self.dirs[wd] + "/" + name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed |= self.addTree(path)
+                elif mask & IN_MOVED_FROM:
+                    # Don't know what was in there
+                    return None
+            elif not mask & IN_CREATE:
+                # New files are reported once written
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher(object):
+    """ Finds the files changed below a directory by looking at all of them every interval seconds """
+    def __init__(self, directory, interval=1.0):
+        self.directory = directory
+        self.interval = interval
+        self.files = self.scan()
+        self.next = time.time() + interval
+
+    def scan(self):
+        result = {}
+        for path in listLocal(self.directory):
+            try:
+                st = os.stat(os.path.join(self.directory, path[1:]))
+                result[path] = (st.st_mtime, st.st_size)
+            except OSError:
+                pass
+        return result
+
+    def wait(self, timeout=None):
+        """ Same as InotifyWatcher.wait """
+        delay = self.next - time.time()
+        if timeout is not None and delay > timeout:
+            time.sleep(max(0, timeout))
+            return set()
+        time.sleep(max(0, delay))
+        self.next = time.time() + self.interval
+
+        files = self.scan()
+        changed = set()
+        for path in set(files) | set(self.files):
+            if files.get(path) != self.files.get(path):
+                changed.add(path)
+        self.files = files
+        return changed
+
+    def close(self):
+        pass
+
+def createWatcher(directory, poll=False, interval=1.0):
+    """ Returns a watcher for directory, using inotify where available unless poll is set """
+    if not poll:
+        libc = loadInotify()
+        if libc is not None:
+            try:
+                return InotifyWatcher(directory, libc)
+            except OSError:
+                pass
+    return PollingWatcher(directory, interval)
+
+class BundleWatch(object):
+    """
+    Pushes the files of a local directory to a SA/DTH as soon as they're
+    saved, using a BundleSync. Editors tend to write a file several times
+    (or several files) in one go, so nothing is pushed until there have
+    been no changes for debounce seconds. Only files which changed are
+    looked at, with the contents of the bundle kept in memory between
+    pushes. Compile errors are shown right away, and if publish is set
+    the SA/DTH is published after every successful push.
+    """
+    DEBOUNCE = 0.5
+
+    def __init__(self, sync, watcher, debounce=DEBOUNCE, publish=False, delete=False):
+        self.sync = sync
+        self.watcher = watcher
+        self.debounce = debounce
+        self.publish = publish
+        self.delete = delete
+
+    def collect(self):
+        """ Waits for a burst of changes to end, returns the changed files (None for all) """
+        changed = set()
+        pending = False
+        while True:
+            # Don't wait forever, to keep this interruptible with CTRL-C
+            events = self.watcher.wait(self.debounce if pending else 1.0)
+            if events is None:
+                changed = None
+                pending = True
+            elif events:
+                if changed is not None:
+                    changed |= events
+                pending = True
+            elif pending:
+                return changed
+
+    def push(self, changed):
+        """ Sends the changed files (None for all) to the server, returns False if anything failed """
+        details = self.sync.details
+        if details is None:
+            details = self.sync.getDetails()
+            if details is None:
+                print("ERROR: Unable to get the contents of the bundle")
+                return False
+        plan = [p for p in self.sync.plan(details, self.delete, changed) if p[0] != "skip"]
+        if len(plan) == 0:
+            return True
+        print("[%s] %d file(s) changed" % (time.strftime("%H:%M:%S"), len(plan)))
+        ok = self.sync.run(details, plan)
+        if ok and self.publish:
+            ok = self.sync.publish()
+        return ok
+
+    def run(self):
+        """ Watches and pushes until interrupted with CTRL-C """
+        print('Watching "%s" for changes, press CTRL-C to stop' % self.sync.directory)
+        sys.stdout.flush()
+        try:
+            while True:
+                self.push(self.collect())
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            print("")
+        finally:
+            self.watcher.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+# Times loading a list of 1000 SmartApps into the console tree, and every
+# parsing call made along the way, against the versions which compiled
+# their regular expression on each call.
+#
+# Usage: tools/bench_loadlist.py [--modules 1000] [--repeat 20]
+#
+import argparse
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from classes import parsing
+from classes.console import ConsoleAccess
+from bench_parsing import makePage
+
+def legacySanitizeName(name):
+    rpl = { "/" : "-", "(" : "-", ")" : "-", " " : "-" }
+    for f,t in rpl.iteritems():
+        name = name.replace(f, t)
+    p = re.compile('\-+')
+    name = p.sub("-", name)
+    if name[-1:] == '-':
+        name = name[:-1]
+    return name.lower()
+
+def legacyExtractErrorMessage(content):
+    p = re.compile('\<div class=\"alert alert\-danger alert\-dismissible flash\"\>(.+?)\<\/div\>', re.MULTILINE|re.IGNORECASE|re.DOTALL)
+    m = p.search(content)
+    if m:
+        p = re.compile('<[^>]+?>.*?</[^>]+?>')
+        return p.sub("", m.group(1)).strip()
+    return None
+
+def legacyParseSmartAppIds(block):
+    p = re.compile('ST\.AppIDE\.init\(\{.+?url: \'([^\']+)\',.+?websocket: \'([^\']+)\',.+?client: \'([^\']+)\',.+?id: \'([^\']+)\',.+?versionId: \'([^\']+)\',.+?state: \'([^\']+)\'', re.MULTILINE|re.IGNORECASE|re.DOTALL)
+    m = p.search(block)
+    if m:
+        return {"url" : m.group(1), "websocket" : m.group(2), "client" : m.group(3), "id" : m.group(4), "versionid" : m.group(5), "state" : m.group(6)}
+    return None
+
+def legacyParseJobs(line):
+    m = re.match('-j\s*([0-9]+)\s+(.*)', line)
+    if m:
+        return max(1, int(m.group(1))), m.group(2)
+    return 1, line
+
+class ListingServer(object):
+    """ Stands in for STServer, handing out the same listing page every time """
+    def __init__(self, count):
+        self.page = makePage("app", count)
+
+    def listSmartApps(self):
+        parser = parsing.ListingParser("/ide/app/editor/")
+        parser.feed(self.page)
+        return parser.close()
+
+def loadList(conn, sanitize):
+    """ Fills an empty console tree with the SmartApps of conn """
+    console = ConsoleAccess()
+    console.conn = conn
+    console.diskcache = None
+    console.prefetched = {}
+    console.sanitizeName = sanitize
+    console.resetTree()
+    console.loadList("/smartapps")
+    return console
+
+def perCall(func, args, repeat):
+    """ Returns the best time in microseconds of calling func on each of args """
+    def run():
+        for a in args:
+            func(a)
+    return min(timeit.repeat(run, number=1, repeat=repeat)) * 1000000 / len(args)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks populating the console tree and the parsing it takes", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--modules', type=int, default=1000, help="How many SmartApps the list holds")
+    parser.add_argument('--repeat', type=int, default=20, help="How many times everything is timed, the best time is shown")
+    args = parser.parse_args()
+
+    conn = ListingServer(args.modules)
+    modules = conn.listSmartApps().values()
+    names = [d["namespace"] for d in modules] + [d["name"] for d in modules]
+
+    if sorted(loadList(conn, legacySanitizeName).tree) != sorted(loadList(conn, parsing.sanitizeName).tree):
+        print("ERROR: Trees differ")
+        sys.exit(1)
+
+    def cold(name):
+        parsing.sanitized.clear()
+        return parsing.sanitizeName(name)
+
+    error = '<html><body><div class="alert alert-danger alert-dismissible flash"><button>x</button>Compilation failed: unexpected token</div></body></html>'
+    block = "ST.AppIDE.init({\n url: '/ide/app/',\n websocket: 'wss://example.com:8443/',\n client: 'abc',\n id: 'def',\n versionId: 'ghi',\n state: 'NOT_APPROVED'\n });"
+
+    print("%-24s %8s %12s %12s" % ("Call", "Calls", "before us", "after us"))
+    rows = [
+        ("sanitizeName (cold)", names, legacySanitizeName, cold),
+        ("sanitizeName", names, legacySanitizeName, parsing.sanitizeName),
+        ("extractErrorMessage", [error] * 1000, legacyExtractErrorMessage, parsing.extractErrorMessage),
+        ("parseSmartAppIds", [block] * 1000, legacyParseSmartAppIds, parsing.parseSmartAppIds),
+        ("parseJobs", ["-j 4 /smartapps"] * 1000, legacyParseJobs, parsing.parseJobs)
+    ]
+    for label, items, before, after in rows:
+        print("%-24s %8d %12.2f %12.2f" % (label, len(items), perCall(before, items, args.repeat), perCall(after, items, args.repeat)))
+
+    print("%-24s %8d %12.2f %12.2f" % ("loadList per module", len(modules),
+        perCall(lambda c: loadList(c, legacySanitizeName), [conn], args.repeat) / len(modules),
+        perCall(lambda c: loadList(c, parsing.sanitizeName), [conn], args.repeat) / len(modules)))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Compares ListingParser with the regular expression the listings used to
+# be parsed with, on synthetic /ide/apps and /ide/devices pages of
+# 10, 100 and 1000 entries.
+#
+# Usage: tools/bench_parsing.py [--repeat 20]
+#
+import argparse
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes.parsing import ListingParser
+
+LEGACY = {
+    "app" : re.compile('\\<a href="/ide/app/editor/([^"]+)".*?\\>\\<img .+?\\>\\s*(.+?)\\s*:\\s*(.+?)\\</a\\>', re.MULTILINE|re.IGNORECASE|re.DOTALL),
+    "device" : re.compile('\\<a href="/ide/device/editor/([^"]+)".*?\\>\\s*(.+?)\\s*:\\s*(.+?)\\</a\\>', re.MULTILINE|re.IGNORECASE|re.DOTALL)
+}
+
+def makePage(prefix, count):
+    """ Builds a listing page looking like the WebIDE's """
+    rows = []
+    for i in range(count):
+        uuid = "%08x-0000-4000-8000-%012x" % (i, i)
+        icon = '<img src="/images/icon.png" alt="">' if prefix == "app" else ''
+        rows.append('<tr class="row-%d">\n<td>\n<a href="/ide/%s/editor/%s" class="ide-link" title="Edit">%s\n namespace%d : Bundle %d</a>\n</td>\n<td>Published</td>\n<td>%s</td>\n</tr>' % (i, prefix, uuid, icon, i % 7, i, "Lorem ipsum " * 10))
+    return '<html><head><title>My %ss</title></head><body><table>\n%s\n</table></body></html>' % (prefix, "\n".join(rows))
+
+def parseLegacy(prefix, page):
+    result = {}
+    for i in LEGACY[prefix].findall(page):
+        result[i[0]] = {'id' : i[0], 'namespace' : i[1], 'name' : i[2]}
+    return result
+
+def parseNew(prefix, page, chunk=None):
+    parser = ListingParser("/ide/%s/editor/" % prefix)
+    if chunk is None:
+        parser.feed(page)
+    else:
+        for i in range(0, len(page), chunk):
+            parser.feed(page[i:i + chunk])
+    return parser.close()
+
+def best(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the parsing of SmartApp/DeviceType listings", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20, help="How many times every parse is timed, the best time is shown")
+    args = parser.parse_args()
+
+    print("%-8s %7s %10s %12s %12s %14s" % ("Page", "Entries", "KB", "regex ms", "parser ms", "64KB chunks ms"))
+    for prefix in ["app", "device"]:
+        for count in [10, 100, 1000]:
+            page = makePage(prefix, count)
+            if parseLegacy(prefix, page) != parseNew(prefix, page) or parseNew(prefix, page) != parseNew(prefix, page, 65536):
+                print("ERROR: Parsers disagree on %s page with %d entries" % (prefix, count))
+                sys.exit(1)
+            print("%-8s %7d %10.1f %12.3f %12.3f %14.3f" % (prefix, count, len(page) / 1024.0,
+                best(lambda: parseLegacy(prefix, page), args.repeat) * 1000,
+                best(lambda: parseNew(prefix, page), args.repeat) * 1000,
+                best(lambda: parseNew(prefix, page, 65536), args.repeat) * 1000))
+
+    # A SmartApp without an icon makes the old pattern search the rest of the page
+    page = makePage("app", 1000).replace('<img src="/images/icon.png" alt="">', '', 500)
+    print("%-8s %7d %10.1f %12.3f %12.3f %14.3f" % ("no icon", 1000, len(page) / 1024.0,
+        best(lambda: parseLegacy("app", page), 3) * 1000,
+        best(lambda: parseNew("app", page), 3) * 1000,
+        best(lambda: parseNew("app", page, 65536), 3) * 1000))
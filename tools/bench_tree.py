@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# Compares the memory taken by the console tree with the dict per node it
+# used to be made of, on a synthetic account of about 50000 nodes. Every
+# representation is built in a process of its own, so the growth of its
+# RSS can be told apart.
+#
+# Usage: tools/bench_tree.py [--nodes 50000]
+#
+import argparse
+import collections
+import gc
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes.tree import ConsoleTree, getRss
+
+FOLDERS = [u"css", u"i18n", u"images", u"javascript", u"other", u"src", u"views"]
+
+class LegacyTree(object):
+    """ The tree as it was, a dict per node by absolute path plus an index of the children """
+    def __init__(self):
+        self.nodes = {}
+        self.children = {"" : set()}
+
+    def __contains__(self, path):
+        return path in self.nodes
+
+    def __getitem__(self, path):
+        return self.nodes[path]
+
+    def __setitem__(self, path, node):
+        if path not in self.nodes:
+            parent, _, name = path.rpartition("/")
+            if parent not in self.children:
+                self.children[parent] = set()
+            self.children[parent].add(name)
+        self.nodes[path] = node
+
+def account(nodes):
+    """ Yields (bundle uuid, bundle path, {file uuid : path in bundle}) adding up to about nodes nodes """
+    files = 12
+    perbundle = 1 + len(FOLDERS) + len(FOLDERS) * files
+    for i in range(max(1, nodes / perbundle)):
+        uuid = u"%08x-0000-4000-8000-%012x" % (i, i)
+        base = u"/smartapps" if i % 2 else u"/devicetypes"
+        flat = {}
+        for f in FOLDERS:
+            for j in range(files):
+                flat[u"%08x-%04x-4000-8000-%012x" % (i, FOLDERS.index(f), j)] = u"/%s/file%d.bin" % (f, j)
+        yield uuid, u"%s/namespace%d/bundle-%d.src" % (base, i % 10, i), flat
+
+def trail(tree, filename, add):
+    cd = u""
+    for p in filename.split(u"/")[1:]:
+        cd += u"/" + p
+        if cd not in tree:
+            add(cd)
+
+def buildLegacy(nodes):
+    tree = LegacyTree()
+    for base, kind in [(u"/smartapps", 'sa'), (u"/devicetypes", 'dth')]:
+        tree[base] = {"name" : base, "dir" : True, "uuid" : None, "parent" : None, "type" : None, "stale" : False}
+    for uuid, filename, flat in account(nodes):
+        kind = 'sa' if filename.startswith(u"/smartapps") else 'dth'
+        tree[filename] = {"name" : filename, "dir" : True, "parent" : uuid, "uuid" : None, "type" : kind, "stale" : False}
+        def add(cd):
+            tree[cd] = {"name" : cd, "uuid" : None, "parent" : uuid, "type" : kind, "stale" : False, "dir" : True}
+        for k, v in flat.iteritems():
+            path = filename + v
+            tree[path] = {"name" : path, "dir" : False, "parent" : uuid, "uuid" : k, "type" : kind, "stale" : False}
+            trail(tree, path, add)
+    return tree, list(tree.nodes), len(tree.nodes)
+
+def buildCompact(nodes):
+    tree = ConsoleTree()
+    tree.add(u"/smartapps", True, kind='sa')
+    tree.add(u"/devicetypes", True, kind='dth')
+    for uuid, filename, flat in account(nodes):
+        tree.add(filename, True, module=uuid)
+        for k, v in flat.iteritems():
+            tree.add(filename + v, False, uuid=k)
+    return tree, list(tree), len(tree)
+
+def measure(kind, nodes):
+    """ Builds one tree, returns its size, growth of RSS, build and lookup times """
+    gc.collect()
+    before = getRss()
+    start = time.time()
+    tree, paths, count = {"legacy" : buildLegacy, "compact" : buildCompact}[kind](nodes)
+    built = time.time() - start
+    # Lookups are timed on paths built the way the console builds them
+    paths = [u"%s" % p for p in paths]
+    gc.collect()
+    rss = getRss() - before - sys.getsizeof(paths) - sum(sys.getsizeof(p) for p in paths)
+    start = time.time()
+    for p in paths:
+        tree[p]
+    lookup = time.time() - start
+    return {"nodes" : count, "rss" : rss, "build" : built, "lookup" : lookup / len(paths)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the memory used by the console tree", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=50000, help="Approximate number of nodes in the tree")
+    parser.add_argument('--build', choices=["legacy", "compact"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build:
+        print(repr(measure(args.build, args.nodes)))
+        sys.exit(0)
+
+    if getRss() is None:
+        print("ERROR: Can't tell how much memory is used on this platform")
+        sys.exit(1)
+
+    print("%-8s %8s %10s %10s %10s %12s" % ("Tree", "Nodes", "RSS MB", "B/node", "build s", "lookup us"))
+    results = collections.OrderedDict()
+    for kind in ["legacy", "compact"]:
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--build", kind, "--nodes", str(args.nodes)])
+        r = results[kind] = eval(out)
+        print("%-8s %8d %10.1f %10d %10.2f %12.2f" % (kind, r["nodes"], r["rss"] / 1048576.0, r["rss"] / r["nodes"], r["build"], r["lookup"] * 1000000))
+    print("RSS reduced by %.0f%%" % (100 - 100.0 * results["compact"]["rss"] / results["legacy"]["rss"]))
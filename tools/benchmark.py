@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+# Times the common stshell operations against the fake WebIDE in
+# tools/mockide.py, so performance changes can be measured without the
+# real backend. Every run is appended to a history file keyed by the
+# version (git describe) and compared to the previous run.
+#
+# Usage: tools/benchmark.py [--latency 0.02] [--smartapps 200] [--repeat 5]
+#
+import argparse
+import json
+import os
+import random
+import shutil
+import StringIO
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from classes.stshell import STServer
+from classes.console import ConsoleAccess
+from mockide import Account, startServer
+
+def getVersion():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+class Quiet(object):
+    """ Swallows everything stshell prints while an operation is timed """
+    def __enter__(self):
+        self.saved = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = StringIO.StringIO()
+
+    def __exit__(self, *args):
+        sys.stdout, sys.stderr = self.saved
+
+class Benchmark(object):
+    """ Runs every bench_* method against a fresh mock server and records the timings """
+    def __init__(self, server, workdir, repeat=3, jobs=8):
+        self.server = server
+        self.workdir = workdir
+        self.repeat = repeat
+        self.jobs = jobs
+        self.results = {}
+        self.srv = self.connect()
+        apps = sorted(self.srv.listSmartApps().values(), key=lambda x: x["id"])
+        self.smartapp = apps[0]
+
+    def connect(self):
+        srv = STServer("bench", "bench", self.server.getUrl())
+        srv.login()
+        return srv
+
+    def console(self):
+        c = ConsoleAccess()
+        c.setConnection(self.connect())
+        return c
+
+    def modulePath(self, c, module):
+        return c.getModulePath("/smartapps", module)
+
+    def measure(self, name, func, setup=None):
+        """ Runs func (given the result of setup) repeat times, recording the best and median time """
+        times = []
+        for i in range(self.repeat):
+            arg = setup(i) if setup else i
+            with Quiet():
+                start = time.time()
+                func(arg)
+                times.append(time.time() - start)
+        times.sort()
+        self.results[name] = {"best" : times[0], "median" : times[len(times) / 2]}
+        print("  %-24s best %8.3fs  median %8.3fs" % (name, times[0], times[len(times) / 2]))
+
+    def scratch(self, i):
+        """ Returns an empty directory for one repetition """
+        path = os.path.join(self.workdir, "run%d" % i)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        return path
+
+    def bench_login(self):
+        self.measure("login", lambda i: self.connect())
+
+    def bench_list(self):
+        def run(i):
+            self.srv.listSmartApps()
+            self.srv.listDeviceTypes()
+        self.measure("list", run)
+
+    def bench_contents(self):
+        self.measure("contents", lambda i: self.srv.getSmartAppDetails(self.smartapp["id"]))
+
+    def bench_download(self):
+        self.measure("download", lambda path: self.srv.downloadSmartApp(self.smartapp["id"], path + "/bundle"), self.scratch)
+        self.measure("download -j %d" % self.jobs, lambda path: self.srv.downloadSmartApp(self.smartapp["id"], path + "/bundle", self.jobs), self.scratch)
+
+    def bench_startup(self):
+        def run(i):
+            c = self.console()
+            c.onecmd("cd /smartapps")
+            c.onecmd("ls")
+        self.measure("console startup", run)
+
+    def bench_browse(self):
+        """ cd/ls around a tree where every SmartApp has been opened """
+        c = self.console()
+        with Quiet():
+            c.onecmd("ls /smartapps")
+            modules = [p for p in c.tree.walk("/smartapps") if c.tree[p]["parent"] and c.tree[p]["uuid"] is None]
+            for m in modules:
+                c.onecmd("ls " + m)
+        rnd = random.Random(0)
+        dirs = [p for p in c.tree.walk("/smartapps") if c.tree[p]["dir"]]
+        def run(i):
+            for j in range(500):
+                c.onecmd("cd " + rnd.choice(dirs))
+                c.onecmd("ls")
+        self.measure("ls/cd (%d nodes)" % len(c.tree), run)
+
+    def bench_get(self):
+        def setup(i):
+            path = self.scratch(i)
+            os.chdir(path)
+            c = self.console()
+            with Quiet():
+                c.onecmd("cd " + os.path.dirname(self.modulePath(c, self.smartapp)))
+            return c
+        name = os.path.basename(self.modulePath(ConsoleAccess(), self.smartapp))
+        self.measure("get", lambda c: c.onecmd("get " + name), setup)
+        self.measure("get -j %d" % self.jobs, lambda c: c.onecmd("get -j %d %s" % (self.jobs, name)), setup)
+
+    def bench_mput(self):
+        def setup(i):
+            path = self.scratch(i)
+            os.chdir(path)
+            for j in range(10):
+                with open("upload%d-%d.png" % (i, j), "wb") as f:
+                    f.write(os.urandom(4096))
+            c = self.console()
+            with Quiet():
+                c.onecmd("cd " + self.modulePath(c, self.smartapp) + "/images")
+            return c
+        self.measure("mput (10 files)", lambda c: c.onecmd("mput *.png"), setup)
+
+    def run(self):
+        cwd = os.getcwd()
+        try:
+            for name in sorted(dir(self)):
+                if name.startswith("bench_"):
+                    getattr(self, name)()
+        finally:
+            os.chdir(cwd)
+        return self.results
+
+def compare(results, previous):
+    """ Prints how much every timing changed since the previous run """
+    if previous is None:
+        return
+    print("Compared to %s:" % previous["version"])
+    for name in sorted(results):
+        if name not in previous["results"]:
+            continue
+        before = previous["results"][name]["median"]
+        after = results[name]["median"]
+        if before > 0:
+            print("  %-24s %+7.1f%%" % (name, (after - before) * 100 / before))
+
+def loadHistory(filename):
+    history = []
+    try:
+        with open(filename, "r") as f:
+            for line in f:
+                history.append(json.loads(line))
+    except IOError:
+        pass
+    return history
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks stshell against a fake WebIDE", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--smartapps', type=int, default=100, help="Number of SmartApps in the fake account")
+    parser.add_argument('--devicetypes', type=int, default=100, help="Number of DeviceTypes in the fake account")
+    parser.add_argument('--files', type=int, default=20, help="Number of resources per bundle")
+    parser.add_argument('--filesize', type=int, default=16384, help="Size of each resource in bytes")
+    parser.add_argument('--latency', type=float, default=0.01, help="Average delay in seconds added to every request")
+    parser.add_argument('--error-rate', type=float, default=0.0, dest='errorrate', help="Fraction of requests answered with HTTP 500")
+    parser.add_argument('--repeat', type=int, default=3, help="How many times every operation is timed")
+    parser.add_argument('-j', '--jobs', type=int, default=8, help="Parallelism used for the -j variants")
+    parser.add_argument('--history', default="bench_history.jsonl", help="File the results are appended to")
+    args = parser.parse_args()
+
+    config = {"smartapps" : args.smartapps, "devicetypes" : args.devicetypes, "files" : args.files, "filesize" : args.filesize, "latency" : args.latency, "errorrate" : args.errorrate}
+    server = startServer(Account(args.smartapps, args.devicetypes, args.files, args.filesize), latency=args.latency, errorrate=args.errorrate)
+    workdir = tempfile.mkdtemp(prefix="stshell-bench-")
+    version = getVersion()
+    print("Benchmarking %s against %s" % (version, server.getUrl()))
+    try:
+        results = Benchmark(server, workdir, args.repeat, args.jobs).run()
+    finally:
+        server.stop()
+        shutil.rmtree(workdir)
+
+    history = loadHistory(args.history)
+    previous = None
+    for entry in reversed(history):
+        if entry["config"] == config:
+            previous = entry
+            break
+    compare(results, previous)
+    with open(args.history, "a") as f:
+        f.write(json.dumps({"version" : version, "time" : time.time(), "config" : config, "results" : results}) + "\n")
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+#
+# A fake SmartThings WebIDE, implementing the parts of it stshell talks to
+# (see STServer.URL_PATH). It serves a synthetic account of configurable
+# size and can add latency and errors, which makes it possible to test and
+# benchmark stshell without touching the real backend.
+#
+# Usage: tools/mockide.py --port 8080 --smartapps 200 --devicetypes 200
+#        stshell --server http://127.0.0.1:8080 -u test -p test console
+#
+import argparse
+import cgi
+import json
+import mimetypes
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import urlparse
+import uuid as uuidlib
+import BaseHTTPServer
+import SocketServer
+
+UPLOAD_FOLDERS = {
+    'OTHER'     : 'src',
+    'IMAGE'     : 'images',
+    'CSS'       : 'css',
+    'I18N'      : 'i18n',
+    'JAVASCRIPT': 'javascript',
+    'VIEW'      : 'views'
+}
+
+# Resources generated for the synthetic account, the first one of every
+# bundle is an image so there's always an images folder to upload to
+RESOURCE_TYPES = [('IMAGE', 'images', 'png'), ('JAVASCRIPT', 'javascript', 'js'), ('CSS', 'css', 'css'), ('I18N', 'i18n', 'properties')]
+
+class Resource(object):
+    def __init__(self, folder, filename, kind, content):
+        self.id = str(uuidlib.uuid4())
+        self.folder = folder
+        self.filename = filename
+        self.kind = kind
+        self.contenttype = mimetypes.guess_type(filename)[0] or "text/plain"
+        self.content = content
+
+class Bundle(object):
+    def __init__(self, kind, namespace, name, code):
+        self.kind = kind
+        self.id = str(uuidlib.uuid4())
+        self.versionid = str(uuidlib.uuid4())
+        self.namespace = namespace
+        self.name = name
+        self.resources = {}
+        main = Resource("", re.sub('[^a-z0-9]+', '-', name.lower()).strip("-") + ".groovy", "SCRIPT", code)
+        self.resources[main.id] = main
+
+    def add(self, resource):
+        self.resources[resource.id] = resource
+        return resource
+
+    def tree(self):
+        """ Returns the resources in the jstree format the WebIDE uses """
+        root = []
+        folders = {"" : root}
+        for r in sorted(self.resources.values(), key=lambda x: (x.folder, x.filename)):
+            path = ""
+            for part in [p for p in r.folder.split("/") if p]:
+                parent = folders[path]
+                path += "/" + part
+                if path not in folders:
+                    folders[path] = []
+                    parent.append({"text" : part, "children" : folders[path]})
+            folders[path].append({"text" : r.filename, "id" : r.id, "li_attr" : {"resource-type" : r.kind, "resource-content-type" : r.contenttype}})
+        return root
+
+class Account(object):
+    """ A synthetic account holding SmartApps and DeviceTypes """
+    def __init__(self, smartapps=10, devicetypes=10, files=5, filesize=4096, seed=0):
+        self.lock = threading.Lock()
+        self.bundles = {}
+        self.versions = {}
+        rnd = random.Random(seed)
+        for kind, count in [('sa', smartapps), ('dth', devicetypes)]:
+            for i in range(count):
+                b = self.create(kind, "namespace%d" % (i % 7), "%s Bundle (%d)" % (kind.upper(), i))
+                for j in range(files):
+                    rtype, folder, ext = RESOURCE_TYPES[0] if j == 0 else rnd.choice(RESOURCE_TYPES)
+                    data = "".join(chr(rnd.randint(32, 126)) for _ in range(64)) * max(1, filesize / 64)
+                    b.add(Resource(folder, "file%d.%s" % (j, ext), rtype, data))
+
+    def create(self, kind, namespace, name):
+        code = 'definition(name: "%s", namespace: "%s")\n' % (name, namespace)
+        b = Bundle(kind, namespace, name, code)
+        self.bundles[b.id] = b
+        self.versions[b.versionid] = b
+        return b
+
+    def find(self, ident, kind):
+        b = self.bundles.get(ident) or self.versions.get(ident)
+        if b is None or b.kind != kind:
+            return None
+        return b
+
+class MockHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send every response in one go, writing the headers one by one gets
+    # them stuck between Nagle and delayed ACKs on kept alive connections
+    wbufsize = -1
+    COOKIE = "JSESSIONID"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, fmt, *args)
+
+    def reply(self, status, body="", headers=None, contenttype="text/html"):
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", contenttype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, headers=None):
+        headers = dict(headers or {})
+        headers["Location"] = "http://%s%s" % (self.headers.get("Host", "localhost"), location)
+        self.reply(302, "", headers)
+
+    def readForm(self):
+        """ Returns the query and body parameters of the request as a dict """
+        url = urlparse.urlparse(self.path)
+        params = dict((k, v[0]) for k, v in urlparse.parse_qs(url.query).items())
+        if self.command != "POST":
+            return params
+        ctype = self.headers.get("Content-Type", "")
+        if ctype.startswith("multipart/form-data"):
+            form = cgi.FieldStorage(fp=self.rfile, headers=self.headers, environ={"REQUEST_METHOD" : "POST", "CONTENT_TYPE" : ctype})
+            for k in form.keys():
+                item = form[k]
+                if item.filename:
+                    params[k] = (item.filename, item.value)
+                else:
+                    params[k] = item.value
+        else:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length)
+            params.update(dict((k, v[0]) for k, v in urlparse.parse_qs(body, keep_blank_values=True).items()))
+        return params
+
+    def isLoggedIn(self):
+        return ("%s=%s" % (MockHandler.COOKIE, self.server.session)) in self.headers.get("Cookie", "")
+
+    def handle_request(self):
+        server = self.server
+        path = re.sub('/+', '/', urlparse.urlparse(self.path).path)
+        params = self.readForm()
+        server.count(path)
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+        if path.startswith("/login"):
+            return self.reply(200, "<html><body>Login page</body></html>")
+        if path == "/j_spring_security_check":
+            if server.username and (params.get("j_username") != server.username or params.get("j_password") != server.password):
+                return self.redirect("/login/authfail?login_error=1")
+            return self.redirect("/", {"Set-Cookie" : "%s=%s; Path=/" % (MockHandler.COOKIE, server.session)})
+        if not self.isLoggedIn():
+            return self.redirect("/login/auth")
+        if server.errorrate and random.random() < server.errorrate:
+            return self.reply(500, "<html><body>Internal server error</body></html>")
+
+        m = re.match('/ide/(app|device)(s$|/)(.*)$', path)
+        if m is None:
+            return self.reply(404, "Not found")
+        kind = 'sa' if m.group(1) == 'app' else 'dth'
+        with server.account.lock:
+            if m.group(2) == 's':
+                return self.reply(200, self.listing(kind, m.group(1)))
+            return self.dispatch(kind, m.group(1), m.group(3), params)
+
+    def dispatch(self, kind, prefix, action, params):
+        account = self.server.account
+        if action.startswith("editor/"):
+            b = account.find(action[7:], kind)
+            if b is None:
+                return self.reply(404, "Not found")
+            return self.reply(200, self.editor(b, prefix))
+        if action.startswith("delete/") and kind == 'sa':
+            b = account.find(action[7:], kind)
+            if b is None:
+                return self.reply(200, self.alert("No such SmartApp"))
+            account.bundles.pop(b.id)
+            return self.redirect("/ide/apps")
+        if action == "update" and kind == 'dth' and "_action_delete" in params:
+            b = account.find(params.get("id"), kind)
+            if b is None:
+                return self.reply(200, self.alert("No such DeviceType"))
+            account.bundles.pop(b.id)
+            return self.redirect("/ide/devices")
+        if action == "saveFromCode":
+            content = params.get("content", "")
+            m = re.search('name:\s*"([^"]+)",\s*namespace:\s*"([^"]+)"', content)
+            if not m:
+                return self.reply(200, self.alert("No definition found"))
+            b = account.create(kind, m.group(2), m.group(1))
+            b.resources.values()[0].content = content
+            return self.redirect("/ide/%s/editor/%s" % (prefix, b.id))
+
+        b = account.find(params.get("id"), kind)
+        if b is None:
+            return self.reply(404, "Not found")
+        if action == "getResourceList":
+            return self.reply(200, json.dumps(b.tree()), contenttype="application/json")
+        if action == "getCodeForResource":
+            r = b.resources.get(params.get("resourceId"))
+            if r is None:
+                return self.reply(404, "Not found")
+            return self.reply(200, r.content, contenttype=r.contenttype)
+        if action == "compile":
+            r = b.resources.get(params.get("resource"))
+            if r is None:
+                return self.reply(404, "Not found")
+            code = params.get("code", "")
+            if "COMPILE_ERROR" in code:
+                result = {"errors" : ["script1.groovy: 1: unexpected token"], "output" : []}
+            else:
+                r.content = code
+                result = {"errors" : [], "output" : []}
+            return self.reply(200, json.dumps(result), contenttype="application/json")
+        if action == "uploadResources":
+            filename, data = params["fileData"]
+            rtype = params.get("file-type|" + filename, "OTHER")
+            folder = "/".join(p for p in [UPLOAD_FOLDERS.get(rtype, "src"), params.get("file-path|" + filename, "")] if p)
+            b.add(Resource(folder, filename, rtype, data))
+            return self.reply(200, "<html><body>Uploaded</body></html>")
+        if action == "deleteResource":
+            if b.resources.pop(params.get("resourceId"), None) is None:
+                return self.reply(404, "Not found")
+            return self.reply(200, "")
+        if action == "publishAjax":
+            # Like the WebIDE, publishing starts a new version
+            del account.versions[b.versionid]
+            b.versionid = str(uuidlib.uuid4())
+            account.versions[b.versionid] = b
+            return self.reply(200, json.dumps({"success" : True}), contenttype="application/json")
+        return self.reply(404, "Not found")
+
+    def alert(self, message):
+        return '<html><body><div class="alert alert-danger alert-dismissible flash"><button type="button" class="close">x</button>%s</div></body></html>' % message
+
+    def listing(self, kind, prefix):
+        rows = []
+        for b in sorted(self.server.account.bundles.values(), key=lambda x: (x.namespace, x.name)):
+            if b.kind != kind:
+                continue
+            icon = '<img src="/images/icon.png" alt="">' if kind == 'sa' else ''
+            rows.append('<tr class="row-%s">\n<td>\n<a href="/ide/%s/editor/%s" class="ide-link" title="Edit">%s\n %s : %s</a>\n</td>\n<td>Published</td>\n<td>%s</td>\n</tr>' % (b.id, prefix, b.id, icon, b.namespace, b.name, "Lorem ipsum " * 10))
+        return '<html><head><title>My %ss</title></head><body><table>\n%s\n</table></body></html>' % (prefix, "\n".join(rows))
+
+    def editor(self, b, prefix):
+        if prefix == 'app':
+            init = "ST.AppIDE.init({\n url: '/ide/app/',\n websocket: 'wss://localhost:8443/',\n client: '%s',\n id: '%s',\n versionId: '%s',\n state: 'NOT_APPROVED'\n});" % (self.server.session, b.id, b.versionid)
+        else:
+            init = "ST.DeviceIDE.init({\n url: '/ide/device/',\n websocket: 'wss://localhost:8443/',\n client: '%s',\n id: '%s'\n});" % (self.server.session, b.versionid)
+        filler = '<script src="/js/library.js"></script>\n' * 200
+        return '<html><head>%s</head><body><script>\n%s\n</script>%s</body></html>' % (filler, init, filler)
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+class MockServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, account, latency=0.0, errorrate=0.0, username=None, password=None, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, MockHandler)
+        self.account = account
+        self.latency = latency
+        self.errorrate = errorrate
+        self.username = username
+        self.password = password
+        self.verbose = verbose
+        self.session = str(uuidlib.uuid4())
+        self.requests = {}
+        self.connections = set()
+        self.statlock = threading.Lock()
+
+    def process_request(self, request, address):
+        with self.statlock:
+            self.connections.add(request)
+        SocketServer.ThreadingMixIn.process_request(self, request, address)
+
+    def shutdown_request(self, request):
+        with self.statlock:
+            self.connections.discard(request)
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+    def stop(self):
+        """ Stops serving and drops the connections clients keep open """
+        self.shutdown()
+        with self.statlock:
+            connections = list(self.connections)
+        for c in connections:
+            try:
+                c.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.server_close()
+
+    def handle_error(self, request, address):
+        # Clients going away (or being shut down along with us) is expected
+        if isinstance(sys.exc_info()[1], socket.error):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, address)
+
+    def count(self, path):
+        with self.statlock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def getUrl(self):
+        return "http://%s:%d" % self.server_address
+
+    def expire(self):
+        """ Invalidates the current session, forcing clients to log in again """
+        self.session = str(uuidlib.uuid4())
+
+def startServer(account, port=0, **kwargs):
+    """ Starts a MockServer in a background thread and returns it """
+    server = MockServer(("127.0.0.1", port), account, **kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake SmartThings WebIDE for testing and benchmarking stshell", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on")
+    parser.add_argument('--smartapps', type=int, default=50, help="Number of SmartApps in the account")
+    parser.add_argument('--devicetypes', type=int, default=50, help="Number of DeviceTypes in the account")
+    parser.add_argument('--files', type=int, default=5, help="Number of resources (besides the code) per bundle")
+    parser.add_argument('--filesize', type=int, default=4096, help="Size of each resource in bytes")
+    parser.add_argument('--latency', type=float, default=0.0, help="Average delay in seconds added to every request")
+    parser.add_argument('--error-rate', type=float, default=0.0, dest='errorrate', help="Fraction of requests answered with HTTP 500")
+    parser.add_argument('-u', '--username', default=None, help="Only accept this username (default is to accept any)")
+    parser.add_argument('-p', '--password', default=None, help="Password for --username")
+    parser.add_argument('-v', '--verbose', action='store_true', default=False, help="Log every request")
+    args = parser.parse_args()
+
+    account = Account(args.smartapps, args.devicetypes, args.files, args.filesize)
+    server = MockServer(("127.0.0.1", args.port), account, args.latency, args.errorrate, args.username, args.password, args.verbose)
+    print("Mock WebIDE listening on %s" % server.getUrl())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass